@@ -1,23 +1,30 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
 import logging
 import os
 import json
 import hashlib
+import hmac
 import croniter
 import datetime
 import time
+import queue
+import threading
 from functools import wraps
 import importlib.util
 import sys
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Set, Tuple
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from logging.handlers import TimedRotatingFileHandler
 import shutil
 import http.client
 import urllib.parse
 import re
 import socket
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 # 替换 passlib 的密码哈希功能
@@ -439,11 +446,26 @@ class ConfigManager:
 
 # 优化任务执行管理
 class TaskManager:
-    def __init__(self, config_manager: ConfigManager):
-        self.config_manager = config_manager
+    # 从环境变量沿用的全局参数：性能参数，以及任务表单中没有对应项的替换策略、修改时间误差、同步引擎和追踪
+    TUNING_FIELDS = ('concurrency', 'adaptive_concurrency', 'request_timeout', 'max_retries', 'retry_budget',
+                     'batch_size', 'page_size', 'max_copy_tasks', 'full_scan_hours',
+                     'replace_strategy', 'mtime_tolerance', 'engine', 'trace_dir')
 
-    def execute_task(self, task_id: Optional[int] = None) -> bool:
-        """执行同步任务"""
+    def __init__(self, config_manager: ConfigManager, max_parallel: int = 1):
+        self.config_manager = config_manager
+        # 同时执行的同步任务数，每个任务使用独立的配置对象和同步引擎实例，互不影响
+        self.max_parallel = max(1, max_parallel)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='sync-task')
+        # 正在执行的任务ID，同一任务不会同时执行两次
+        self._running: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def execute_task(self, task_id: Optional[int] = None, plan_writer: Callable[[Dict], None] = None,
+                     progress: Callable[[str, int, int], None] = None) -> bool:
+        """
+        执行同步任务，返回全部任务是否同步成功。多个任务在任务线程池中并发执行。
+        传入 plan_writer 时只生成同步计划，不修改任何文件，按顺序逐个生成；progress 接收同步过程中的文件计数
+        """
         try:
             logger.info("开始执行同步任务")
 
@@ -455,101 +477,287 @@ class TaskManager:
                 logger.error("配置为空，无法执行同步任务")
                 return False
 
-            # 设置基础环境变量
-            self._setup_env_vars(base_config)
-
             # 处理任务
             tasks = sync_config.get('tasks', [])
             if not tasks:
                 logger.error("没有配置同步任务")
                 return False
 
-            for task in tasks:
-                if task_id is not None and task_id != task['id']:
-                    continue
-
-                self._execute_single_task(task)
+            tasks = [task for task in tasks if task_id is None or task_id == task['id']]
+            if plan_writer is not None:
+                # 计划记录按任务顺序输出
+                return all([self._execute_single_task(base_config, task, plan_writer) for task in tasks])
 
-            return True
+            futures = [self._executor.submit(self._execute_single_task, base_config, task, None, progress)
+                       for task in tasks]
+            return all([future.result() for future in futures])
 
+        except alist_sync.PlanCancelled:
+            raise
         except Exception as e:
             logger.error(f"执行同步任务失败: {str(e)}")
             return False
 
-    def _setup_env_vars(self, base_config: Dict):
-        """设置环境变量"""
-        # 清除旧的环境变量
-        for key in list(os.environ.keys()):
-            if key.startswith('DIR_PAIRS'):
-                del os.environ[key]
-
-        # 设置新的环境变量
-        os.environ.update({
-            'BASE_URL': base_config.get('baseUrl', ''),
-            'USERNAME': base_config.get('username', ''),
-            'PASSWORD': base_config.get('password', ''),
-            'TOKEN': base_config.get('token', '')
-        })
-
-    def _execute_single_task(self, task: Dict):
-        """执行单个任务"""
+    def _execute_single_task(self, base_config: Dict, task: Dict, plan_writer: Callable[[Dict], None] = None,
+                             progress: Callable[[str, int, int], None] = None) -> bool:
+        """执行单个任务，返回是否同步成功"""
         task_name = task.get('taskName', '未知任务')
-        sync_del_action = task.get('syncDelAction', 'none')
-        logger.info(f"[{task_name}] 开始处理任务，差异处置策略: {sync_del_action}")
+        if plan_writer is None:
+            with self._lock:
+                if task['id'] in self._running:
+                    logger.warning(f"[{task_name}] 任务正在执行，跳过本次执行")
+                    return False
+                self._running.add(task['id'])
+        try:
+            config = self.build_config(base_config, task)
+            if config is None:
+                return False
+            logger.info(f"[{task_name}] 开始处理任务，差异处置策略: {config.sync_delete_action}")
+            if not config.dir_pairs:
+                return True
+            return alist_sync.run_sync(config, plan_writer=plan_writer, progress=progress)
+        except alist_sync.PlanCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"[{task_name}] 执行任务失败: {str(e)}")
+            return False
+        finally:
+            if plan_writer is None:
+                with self._lock:
+                    self._running.discard(task['id'])
 
-        os.environ['SYNC_DELETE_ACTION'] = sync_del_action
-        os.environ['EXCLUDE_DIRS'] = task.get('excludeDirs', '')
+    @staticmethod
+    def build_config(base_config: Dict, task: Dict) -> Optional['alist_sync.SyncConfig']:
+        """
+        由基础配置和任务配置生成同步配置。环境变量中只沿用 TUNING_FIELDS 中的全局参数，
+        DRY_RUN、INCLUDE_DIRS、APPLY_PLAN 等改变同步范围或执行方式的配置不影响 Web 任务。
+        同步模式未知时返回 None
+        """
+        task_name = task.get('taskName', '未知任务')
+        env_config = alist_sync.SyncConfig.from_env()
+        config = alist_sync.SyncConfig(
+            base_url=base_config.get('baseUrl', ''),
+            username=base_config.get('username', ''),
+            password=base_config.get('password', ''),
+            token=base_config.get('token', ''),
+            sync_delete_action=(task.get('syncDelAction') or 'none').lower(),
+            exclude_dirs=(task.get('excludeDirs') or '').split(','),
+            include_dirs=[],
+            incremental=bool(task.get('incremental')),
+            compare_hash=bool(task.get('hashCompare')),
+            dry_run=False,
+            task_name=task_name,
+            **{name: getattr(env_config, name) for name in TaskManager.TUNING_FIELDS},
+        )
+        if task.get('concurrency'):
+            config.concurrency = int(task['concurrency'])
 
-        # 添加正则表达式环境变量
-        if task.get('regexPatterns'):
-            os.environ['REGEX_PATTERNS'] = task.get('regexPatterns')
+        # 文件过滤条件，未设置的条件不过滤
+        regex_patterns = task.get('regexPatterns') or ''
+        lines = [line for line in regex_patterns.splitlines() if line.strip()]
+        config.regex_patterns = lines if len(lines) > 1 else [regex_patterns] if regex_patterns else []
+        try:
+            config.file_filter = alist_sync.FileFilter.from_env({
+                'FILTER_MIN_SIZE': str(task.get('minSize') or ''),
+                'FILTER_MAX_SIZE': str(task.get('maxSize') or ''),
+                'FILTER_MODIFIED_AFTER': str(task.get('modifiedAfter') or ''),
+                'FILTER_MODIFIED_BEFORE': str(task.get('modifiedBefore') or ''),
+                'FILTER_INCLUDE_EXTENSIONS': str(task.get('includeExtensions') or ''),
+                'FILTER_EXCLUDE_EXTENSIONS': str(task.get('excludeExtensions') or ''),
+            })
+        except ValueError as e:
+            logger.warning(f"[{task_name}] 文件过滤条件配置错误: {str(e)}，不按大小、时间和扩展名过滤")
+            config.file_filter = alist_sync.FileFilter()
 
         if task['syncMode'] == 'data':
-            self._handle_data_sync(task)
+            TaskManager._apply_data_sync(config, task)
         elif task['syncMode'] == 'file':
-            self._handle_file_sync(task)
+            config.dir_pairs = alist_sync.parse_dir_pairs(f"{path['srcPath']}:{path['dstPath']}"
+                                                          for path in task['paths'])
         elif task['syncMode'] == 'file_move':
-            self._handle_file_move(task)
+            config.dir_pairs = alist_sync.parse_dir_pairs(f"{path['srcPathMove']}:{path['dstPathMove']}"
+                                                          for path in task['paths'])
+            # 删除源目录和删除多余目标目录无法同时生效
+            config.move_file = True
+            config.sync_delete_action = 'none'
+        else:
+            logger.error(f"[{task_name}] 未知的同步模式: {task['syncMode']}")
+            return None
+        return config
 
-    def _handle_data_sync(self, task: Dict):
-        """处理数据同步模式"""
+    @staticmethod
+    def _apply_data_sync(config: 'alist_sync.SyncConfig', task: Dict):
+        """数据同步模式：源存储的同步目录同步到每个目标存储的同名目录"""
         source = task['sourceStorage']
         sync_dirs = task['syncDirs']
-        exclude_dirs = task['excludeDirs']
 
-        if source not in exclude_dirs:
-            exclude_dirs = f'{source}/{exclude_dirs}'
-        exclude_dirs = exclude_dirs.replace('//', '/')
+        # 以 / 开头的排除规则相对源存储填写，已包含源存储路径的保持不变；
+        # 不以 / 开头的相对规则（如 @eaDir、*/@eaDir、**/.cache）保持原样以匹配任意层级
+        source_prefix = source.rstrip('/') + '/'
+        exclude_rules = []
+        for rule in (task.get('excludeDirs') or '').split(','):
+            rule = rule.strip()
+            if not rule:
+                continue
+            if rule.startswith('/') and not (rule == source or rule.startswith(source_prefix)):
+                rule = f'{source}/{rule}'.replace('//', '/')
+            exclude_rules.append(rule)
+        config.exclude_dirs = exclude_rules
 
         dir_pairs = []
         for target in task['targetStorages']:
             if source != target:
                 dir_pair = f"{source}/{sync_dirs}:{target}/{sync_dirs}".replace('//', '/')
                 dir_pairs.append(dir_pair)
+        config.dir_pairs = alist_sync.parse_dir_pairs(dir_pairs)
+        # 多个目标存储共用同一个源目录，一次遍历源目录并发同步到全部目标
+        config.fan_out = True
+
+
+class JobQueueFull(Exception):
+    """等待执行的作业数已达上限"""
+
+
+class JobConflict(Exception):
+    """执行全部任务时已有单个任务的作业在排队或执行"""
+
+
+class SyncJob:
+    """一次后台执行的同步作业，记录状态、进度计数和执行结果"""
+
+    def __init__(self, task_id: Optional[int]):
+        self.id = uuid.uuid4().hex
+        self.task_id = task_id
+        # queued -> running -> succeeded / failed
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.message = '等待执行'
+        # 动作 -> 文件数（scanned/copied/skipped/deleted），以及提交复制的字节数
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def add_progress(self, action: str, count: int, size: int):
+        """同步引擎的进度回调，会在多个线程中调用"""
+        with self._lock:
+            self.counters[action] = self.counters.get(action, 0) + count
+            if size:
+                self.counters['bytesEnqueued'] = self.counters.get('bytesEnqueued', 0) + size
+
+    def start(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        self.message = '正在执行'
+
+    def finish(self, success: bool, message: str):
+        self.finished_at = time.time()
+        self.status = 'succeeded' if success else 'failed'
+        self.message = message
+
+    def to_dict(self) -> Dict:
+        def fmt(ts: Optional[float]) -> Optional[str]:
+            return TimeUtils.timestamp_to_datetime(int(ts)) if ts else None
+
+        with self._lock:
+            counters = dict(self.counters)
+        end = self.finished_at or time.time()
+        return {
+            "jobId": self.id,
+            "taskId": self.task_id,
+            "status": self.status,
+            "message": self.message,
+            "createdAt": fmt(self.created_at),
+            "startedAt": fmt(self.started_at),
+            "finishedAt": fmt(self.finished_at),
+            "durationSeconds": round(end - self.started_at, 1) if self.started_at else 0,
+            "progress": counters,
+        }
 
-        if dir_pairs:
-            os.environ['DIR_PAIRS'] = ';'.join(dir_pairs)
-            alist_sync.main()
 
-    def _handle_file_sync(self, task: Dict):
-        """处理文件同步模式"""
-        dir_pairs = [f"{path['srcPath']}:{path['dstPath']}" for path in task['paths']]
-        if dir_pairs:
-            os.environ['DIR_PAIRS'] = ';'.join(dir_pairs)
-            alist_sync.main()
+class JobManager:
+    """
+    同步作业队列：接口提交作业后立即返回作业ID，作业由有界线程池在后台执行。
+    作业状态只保存在内存中，保留最近 history 个已结束的作业
+    """
 
-    def _handle_file_move(self, task: Dict):
-        """处理文件移动模式"""
-        dir_pairs = [f"{path['srcPathMove']}:{path['dstPathMove']}" for path in task['paths']]
-        if dir_pairs:
-            os.environ['MOVE_FILE'] = 'true'
-            os.environ['DIR_PAIRS'] = ';'.join(dir_pairs)
-            alist_sync.main()
+    def __init__(self, task_manager: TaskManager, max_workers: int = 1, max_pending: int = 20, history: int = 50):
+        self.task_manager = task_manager
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sync-job')
+        # 作业ID -> 作业，按提交顺序排列
+        self._jobs: 'OrderedDict[str, SyncJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, task_id: Optional[int] = None) -> Tuple[SyncJob, bool]:
+        """
+        提交作业，返回 (作业, 是否新建)。同一任务或全部任务的作业已在排队或执行时返回已有作业；
+        执行全部任务时已有单个任务的作业未结束则抛出 JobConflict，等待执行的作业数达到上限时抛出 JobQueueFull
+        """
+        with self._lock:
+            active = [job for job in self._jobs.values() if job.active]
+            for job in active:
+                if job.task_id in (task_id, None):
+                    return job, False
+            if task_id is None and active:
+                raise JobConflict(f"任务 {', '.join(str(job.task_id) for job in active)} 正在排队或执行，"
+                                  f"请等待结束后再执行全部任务")
+            if sum(1 for job in self._jobs.values() if job.status == 'queued') >= self.max_pending:
+                raise JobQueueFull(f"等待执行的作业已达上限 {self.max_pending} 个")
+            job = SyncJob(task_id)
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        logger.info(f"同步作业已提交 - 作业ID: {job.id}, 任务ID: {task_id if task_id is not None else '全部'}")
+        return job, True
+
+    def _run(self, job: SyncJob):
+        job.start()
+        try:
+            success = self.task_manager.execute_task(job.task_id, progress=job.add_progress)
+            job.finish(success, '同步任务执行成功' if success else '同步任务执行失败，请查看日志')
+        except Exception as e:
+            logger.error(f"同步作业执行失败: {job.id}, 错误: {str(e)}")
+            job.finish(False, f"执行任务时发生错误: {str(e)}")
+        with self._lock:
+            self._trim()
+        logger.info(f"同步作业结束 - 作业ID: {job.id}, 状态: {job.status}")
+
+    def _trim(self):
+        """只保留最近的已结束作业，排队和执行中的作业不会被清理"""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[SyncJob]:
+        """按提交时间倒序返回作业"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+
+def get_max_parallel_tasks() -> int:
+    """同时执行的同步任务数，由 MAX_PARALLEL_TASKS 环境变量设置，默认 2"""
+    value = os.environ.get('MAX_PARALLEL_TASKS')
+    try:
+        return max(1, int(value or 2))
+    except ValueError:
+        logger.warning(f"并行任务数(MAX_PARALLEL_TASKS)配置错误: {value}，使用默认值 2")
+        return 2
 
 
 # 创建管理器实例
 config_manager = ConfigManager(STORAGE_DIR)
-task_manager = TaskManager(config_manager)
+task_manager = TaskManager(config_manager, max_parallel=get_max_parallel_tasks())
+job_manager = JobManager(task_manager, max_workers=task_manager.max_parallel)
 
 
 # 优化配置相关接口
@@ -566,14 +774,92 @@ def save_sync_config():
 @app.route('/api/run-task', methods=['POST'])
 @login_required
 def run_task():
+    """提交同步作业后立即返回作业ID，通过 /api/jobs/<作业ID> 查询状态、进度和结果"""
     try:
-        task_id = request.get_json().get('id')
-        if task_manager.execute_task(task_id):
-            return jsonify({"code": 200, "message": "同步任务执行成功"})
-        return jsonify({"code": 500, "message": "同步任务执行失败"})
+        task_id = (request.get_json() or {}).get('id')
+        job, created = job_manager.submit(task_id)
+        message = "同步任务已提交" if created else "同步任务正在执行，已返回当前作业"
+        return jsonify({"code": 200, "message": message, "data": job.to_dict()})
+    except JobConflict as e:
+        return jsonify({"code": 409, "message": str(e)})
+    except JobQueueFull as e:
+        return jsonify({"code": 429, "message": str(e)})
     except Exception as e:
-        logger.error(f"执行任务失败: {str(e)}")
-        return jsonify({"code": 500, "message": f"执行任务时发生错误: {str(e)}"})
+        logger.error(f"提交任务失败: {str(e)}")
+        return jsonify({"code": 500, "message": f"提交任务时发生错误: {str(e)}"})
+
+
+@app.route('/api/jobs', methods=['GET'])
+@login_required
+def list_jobs():
+    """最近提交的同步作业，按提交时间倒序"""
+    return jsonify({"code": 200, "data": [job.to_dict() for job in job_manager.list()]})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id: str):
+    """查询同步作业的状态、进度计数和执行结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"code": 404, "message": "作业不存在或已过期"})
+    return jsonify({"code": 200, "data": job.to_dict()})
+
+
+@app.route('/api/plan-task', methods=['POST'])
+@login_required
+def plan_task():
+    """
+    只生成任务的同步计划，以 JSON Lines 流式返回，不修改任何文件。
+    计划记录经有界队列交给响应，客户端读取慢时遍历暂停，客户端断开后遍历停止
+    """
+    task_id = (request.get_json() or {}).get('id')
+    records = queue.Queue(maxsize=AlistSync.PLAN_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def plan_writer(record: Dict):
+        alist_sync.put_until_cancelled(records, record, cancelled)
+
+    def run():
+        try:
+            task_manager.execute_task(task_id, plan_writer=plan_writer)
+        except alist_sync.PlanCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"生成同步计划失败: {str(e)}")
+        finally:
+            try:
+                alist_sync.put_until_cancelled(records, None, cancelled)
+            except alist_sync.PlanCancelled:
+                logger.info("客户端已断开，停止生成同步计划")
+
+    threading.Thread(target=run, daemon=True).start()
+
+    def generate():
+        try:
+            while True:
+                record = records.get()
+                if record is None:
+                    break
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        finally:
+            cancelled.set()
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    以 Prometheus 文本格式导出同步指标，需要登录。
+    设置 METRICS_TOKEN 环境变量后，监控系统也可以在 Authorization: Bearer 头或 token 参数中提供该令牌抓取
+    """
+    if 'user_id' not in session:
+        metrics_token = os.environ.get('METRICS_TOKEN')
+        provided = request.args.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not metrics_token or not hmac.compare_digest(provided.encode(), metrics_token.encode()):
+            return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(alist_sync.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # 修改存储列表获取接口
@@ -643,10 +929,20 @@ class TimeUtils:
 
 # 优化调度器管理
 class SchedulerManager:
-    def __init__(self, config_manager: ConfigManager, task_manager: TaskManager):
+    def __init__(self, config_manager: ConfigManager, job_manager: JobManager):
         self.scheduler = BackgroundScheduler()
+        self.scheduler.add_listener(self._on_job_submitted, EVENT_JOB_SUBMITTED)
         self.config_manager = config_manager
-        self.task_manager = task_manager
+        self.job_manager = job_manager
+
+    @staticmethod
+    def _on_job_submitted(event):
+        """记录任务实际提交时间相对计划时间的延迟"""
+        if not event.scheduled_run_times:
+            return
+        scheduled = max(event.scheduled_run_times)
+        lag = (datetime.datetime.now(scheduled.tzinfo) - scheduled).total_seconds()
+        alist_sync.metrics.set_scheduler_lag(event.job_id, max(0.0, lag))
 
     def start(self):
         """启动调度器"""
@@ -682,6 +978,15 @@ class SchedulerManager:
         except Exception as e:
             logger.error(f"重新加载任务失败: {e}")
 
+    def _run_scheduled(self, task_id: int):
+        """定时任务提交为同步作业，与立即执行的作业共用任务线程池，同一任务不会重复执行"""
+        try:
+            job, created = self.job_manager.submit(task_id)
+            if not created:
+                logger.warning(f"任务 {task_id} 正在排队或执行，跳过本次调度，当前作业: {job.id}")
+        except JobQueueFull as e:
+            logger.warning(f"任务 {task_id} 调度失败: {str(e)}")
+
     def _add_task(self, task: Dict):
         """添加单个任务"""
         try:
@@ -691,7 +996,7 @@ class SchedulerManager:
 
             job_id = f"sync_task_{task['id']}"
             self.scheduler.add_job(
-                func=self.task_manager.execute_task,
+                func=self._run_scheduled,
                 trigger=CronTrigger.from_crontab(task['cron']),
                 id=job_id,
                 replace_existing=True,
@@ -704,7 +1009,7 @@ class SchedulerManager:
 
 
 # 创建调度器管理器实例
-scheduler_manager = SchedulerManager(config_manager, task_manager)
+scheduler_manager = SchedulerManager(config_manager, job_manager)
 
 
 # 优化相关接口
@@ -1,10 +1,24 @@
 import http.client
 import json
 import re
-from datetime import datetime, timedelta
+import threading
+import time
+import queue
+import sqlite3
+import hashlib
+import random
+import socket
+import asyncio
+import functools
+import ssl
+from collections import deque
+from contextlib import aclosing, closing, contextmanager
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
 import os
 import logging
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Union, Iterator, Iterable, Set, AsyncIterator, Awaitable, Callable
 from logging.handlers import TimedRotatingFileHandler
 from typing import List, Tuple, Pattern
 
@@ -53,37 +67,1429 @@ def setup_logger():
 logger = setup_logger()
 
 
-def parse_time_and_adjust_utc(date_str: str) -> datetime:
+# fromisoformat 无法解析时的兜底格式：任意位数的小数秒（如纳秒精度）、空格分隔、无冒号的时区
+ISO_8601_PATTERN = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?\s*(Z|z|[+-]\d{2}:?\d{2})?$')
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_time_and_adjust_utc(date_str: str) -> Optional[datetime]:
+    """
+    解析时间字符串，返回带时区的时间，不同时区的时间可以直接比较。
+    不带时区的时间按本机时区处理，无法解析时返回 None，相同字符串只解析一次
+    """
+    if not date_str or not isinstance(date_str, str):
+        return None
+    text = date_str.strip()
+    try:
+        dt = datetime.fromisoformat(text[:-1] + "+00:00" if text[-1:] in ("Z", "z") else text)
+    except ValueError:
+        match = ISO_8601_PATTERN.match(text)
+        if not match:
+            return None
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        microsecond = int((fraction or "0")[:6].ljust(6, "0"))
+        tz = None
+        if offset in ("Z", "z"):
+            tz = timezone.utc
+        elif offset:
+            sign = 1 if offset[0] == "+" else -1
+            digits = offset[1:].replace(":", "")
+            tz = timezone(sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:])))
+        try:
+            dt = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond, tz)
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return dt
+
+
+def file_hashes(entry: Dict) -> Dict[str, str]:
+    """
+    读取项目的哈希，返回 算法 -> 小写哈希值。
+    兼容 hash_info 对象和 hashinfo JSON 字符串两种字段
+    """
+    hashes = {}
+    for value in (entry.get("hashinfo"), entry.get("hash_info")):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                continue
+        if isinstance(value, dict):
+            for algorithm, digest in value.items():
+                if digest and isinstance(digest, str):
+                    hashes[str(algorithm).lower()] = digest.strip().lower()
+    return hashes
+
+
+def compare_hashes(src_entry: Dict, dst_entry: Dict) -> Optional[bool]:
+    """两侧存在相同算法的哈希时返回内容是否一致，无法比较时返回 None"""
+    src_hashes = file_hashes(src_entry)
+    if not src_hashes:
+        return None
+    dst_hashes = file_hashes(dst_entry)
+    common = src_hashes.keys() & dst_hashes.keys()
+    if not common:
+        return None
+    return all(src_hashes[algorithm] == dst_hashes[algorithm] for algorithm in common)
+
+
+class SyncMetrics:
+    """
+    进程内的同步指标，以 Prometheus 文本格式导出。
+    Web 界面和同步任务运行在同一进程时共用模块级实例 metrics
+    """
+
+    REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    FILE_ACTIONS = ("scanned", "copied", "skipped", "deleted")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (接口, 结果) -> 请求数
+        self._requests: Dict[Tuple[str, str], int] = {}
+        # 接口 -> [各分桶计数, 总耗时, 总数]
+        self._latency: Dict[str, List] = {}
+        # (任务, 动作) -> 文件数
+        self._files: Dict[Tuple[str, str], int] = {}
+        self._bytes_enqueued: Dict[str, int] = {}
+        self._scheduler_lag: Dict[str, float] = {}
+        # 任务 -> (耗时, 是否成功, 结束时间戳)
+        self._last_run: Dict[str, Tuple[float, bool, float]] = {}
+
+    def observe_request(self, endpoint: str, outcome: str, seconds: float):
+        with self._lock:
+            key = (endpoint, outcome)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.setdefault(endpoint, [[0] * len(self.REQUEST_BUCKETS), 0.0, 0])
+            for i, bound in enumerate(self.REQUEST_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def add_files(self, task: str, action: str, count: int = 1):
+        if count:
+            with self._lock:
+                key = (task, action)
+                self._files[key] = self._files.get(key, 0) + count
+
+    def add_bytes_enqueued(self, task: str, size: int):
+        if size:
+            with self._lock:
+                self._bytes_enqueued[task] = self._bytes_enqueued.get(task, 0) + size
+
+    def set_scheduler_lag(self, job_id: str, seconds: float):
+        with self._lock:
+            self._scheduler_lag[job_id] = seconds
+
+    def set_last_run(self, task: str, seconds: float, success: bool):
+        with self._lock:
+            self._last_run[task] = (seconds, success, time.time())
+
+    @staticmethod
+    def _labels(**labels) -> str:
+        def escape(value) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式输出所有指标"""
+        lines = []
+
+        def family(name: str, metric_type: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            family("alist_sync_requests_total", "counter", "Alist API requests by endpoint and outcome")
+            for (endpoint, outcome), count in sorted(self._requests.items()):
+                lines.append(f"alist_sync_requests_total{self._labels(endpoint=endpoint, outcome=outcome)} {count}")
+
+            family("alist_sync_request_duration_seconds", "histogram", "Alist API request latency")
+            for endpoint, (buckets, total, count) in sorted(self._latency.items()):
+                for bound, bucket_count in zip(self.REQUEST_BUCKETS, buckets):
+                    labels = self._labels(endpoint=endpoint, le=bound)
+                    lines.append(f"alist_sync_request_duration_seconds_bucket{labels} {bucket_count}")
+                labels = self._labels(endpoint=endpoint, le="+Inf")
+                lines.append(f"alist_sync_request_duration_seconds_bucket{labels} {count}")
+                lines.append(f"alist_sync_request_duration_seconds_sum{self._labels(endpoint=endpoint)} {total:.6f}")
+                lines.append(f"alist_sync_request_duration_seconds_count{self._labels(endpoint=endpoint)} {count}")
+
+            family("alist_sync_files_total", "counter", "Files scanned, copied, skipped and deleted per task")
+            for (task, action), count in sorted(self._files.items()):
+                lines.append(f"alist_sync_files_total{self._labels(task=task, action=action)} {count}")
+
+            family("alist_sync_bytes_enqueued_total", "counter", "Bytes of files submitted for copying per task")
+            for task, size in sorted(self._bytes_enqueued.items()):
+                lines.append(f"alist_sync_bytes_enqueued_total{self._labels(task=task)} {size}")
+
+            family("alist_sync_scheduler_lag_seconds", "gauge", "Delay between scheduled and actual start of a job")
+            for job_id, seconds in sorted(self._scheduler_lag.items()):
+                lines.append(f"alist_sync_scheduler_lag_seconds{self._labels(job=job_id)} {seconds:.6f}")
+
+            family("alist_sync_last_run_duration_seconds", "gauge", "Duration of the last run per task")
+            for task, (seconds, _, _) in sorted(self._last_run.items()):
+                lines.append(f"alist_sync_last_run_duration_seconds{self._labels(task=task)} {seconds:.6f}")
+            family("alist_sync_last_run_success", "gauge", "Whether the last run per task succeeded")
+            for task, (_, success, _) in sorted(self._last_run.items()):
+                lines.append(f"alist_sync_last_run_success{self._labels(task=task)} {int(success)}")
+            family("alist_sync_last_run_timestamp_seconds", "gauge", "Unix time the last run per task finished")
+            for task, (_, _, finished) in sorted(self._last_run.items()):
+                lines.append(f"alist_sync_last_run_timestamp_seconds{self._labels(task=task)} {finished:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共用的同步指标
+metrics = SyncMetrics()
+
+
+class SyncTracer:
+    """
+    记录同步过程中各阶段和每个请求的耗时区间，保存为 Chrome/Perfetto 可打开的 JSON 追踪文件。
+    线程引擎按线程、异步引擎按 asyncio 任务区分轨道
+    """
+
+    def __init__(self, trace_dir: str, name: str = "alist_sync", max_events: int = 1_000_000):
+        self.trace_dir = trace_dir
+        self.name = name
+        self.max_events = max_events
+        self.dropped = 0
+        self._events: List[Dict] = []
+        self._tracks: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def _track(self) -> int:
+        """当前线程或 asyncio 任务对应的轨道编号，首次出现时登记轨道名称"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        track = self._tracks.get(key)
+        if track is None:
+            with self._lock:
+                track = self._tracks.setdefault(key, len(self._tracks) + 1)
+                label = task.get_name() if task is not None else threading.current_thread().name
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": track,
+                                     "args": {"name": label}})
+        return track
+
+    @contextmanager
+    def span(self, name: str, category: str, args: Dict = None):
+        track = self._track()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if len(self._events) >= self.max_events:
+                self.dropped += 1
+            else:
+                event = {"name": name, "cat": category, "ph": "X", "pid": self._pid, "tid": track,
+                         "ts": round((start - self._origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1)}
+                if args:
+                    event["args"] = args
+                self._events.append(event)
+
+    def save(self) -> Optional[str]:
+        """写入追踪文件并清空已记录的区间，返回文件路径"""
+        if not self._events:
+            return None
+        with self._lock:
+            events, self._events, self._tracks = self._events, [], {}
+        os.makedirs(self.trace_dir, exist_ok=True)
+        file_name = f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json"
+        path = os.path.join(self.trace_dir, re.sub(r'[^\w.-]', '_', file_name))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped_events": self.dropped}}, f, ensure_ascii=False)
+        logger.info(f"追踪文件已保存: {path}，区间数: {len(events)}")
+        return path
+
+
+def traced(category: str, describe: Callable[..., Dict] = None, name: Callable[..., str] = None):
+    """
+    为 AlistSync 的方法记录追踪区间，describe 根据调用参数生成区间附加信息，name 生成区间名称（默认为方法名）。
+    未开启追踪时只多一次属性判断
+    """
+    def decorator(func):
+        def open_span(tracer: SyncTracer, args, kwargs):
+            span_name = name(*args, **kwargs) if name else func.__name__
+            return tracer.span(span_name, category, describe(*args, **kwargs) if describe else None)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                if self.tracer is None:
+                    return await func(self, *args, **kwargs)
+                with open_span(self.tracer, args, kwargs):
+                    return await func(self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if self.tracer is None:
+                return func(self, *args, **kwargs)
+            with open_span(self.tracer, args, kwargs):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _trace_dirs(src_dir: str, dst_dir: str, *args, **kwargs) -> Dict:
+    return {"src_dir": src_dir, "dst_dir": dst_dir}
+
+
+def _trace_item(src_dir: str, dst_dir: str, item: Dict, *args, **kwargs) -> Dict:
+    return {"src_dir": src_dir, "dst_dir": dst_dir, "name": item.get("name")}
+
+
+def _trace_request(method: str, path: str, *args, **kwargs) -> Dict:
+    return {"method": method, "path": path}
+
+
+def _trace_request_name(method: str, path: str, *args, **kwargs) -> str:
+    return path.split("?", 1)[0]
+
+
+class AlistAPIError(Exception):
+    """Alist 接口请求失败"""
+
+
+class PlanCancelled(Exception):
+    """同步计划的读取方已停止读取"""
+
+
+def put_until_cancelled(records: queue.Queue, record, cancelled: threading.Event, interval: float = 0.5):
+    """向有界队列写入一条记录，队列已满时等待；读取方已停止（cancelled 已设置）时抛出 PlanCancelled"""
+    while not cancelled.is_set():
+        try:
+            records.put(record, timeout=interval)
+            return
+        except queue.Full:
+            continue
+    raise PlanCancelled()
+
+
+def parse_base_url(base_url: str) -> Tuple[bool, str, int]:
+    """解析服务地址，返回 (是否为HTTPS, 主机, 端口)"""
+    match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", base_url)
+    if not match:
+        raise ValueError("Invalid base URL format")
+
+    https = base_url.startswith("https://")
+    port_part = match.group(2)
+    return https, match.group(1), int(port_part) if port_part else (443 if https else 80)
+
+
+class ConnectionPool:
+    """有界的HTTP(S)长连接池，支持请求超时和断线重连"""
+
+    # 复用空闲连接时出现这些错误，说明连接已被服务端关闭，请求未被处理，可以换新连接重发
+    STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+    def __init__(self, base_url: str, max_size: int = 4, timeout: float = 30, idle_timeout: float = 60):
+        self.https, self.host, self.port = parse_base_url(base_url)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_size))
+        # (连接, 最后使用时间)，后进先出以优先复用最近使用的连接
+        self._idle = queue.LifoQueue()
+        logger.info(f"创建连接池 - 主机: {self.host}, 端口: {self.port}, 连接数: {max_size}, 超时: {timeout}秒")
+
+    def _new_connection(self) -> Union[http.client.HTTPConnection, http.client.HTTPSConnection]:
+        """创建HTTP(S)连接"""
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self) -> Tuple[Union[http.client.HTTPConnection, http.client.HTTPSConnection], bool]:
+        """取得一个连接，返回 (连接, 是否为复用的空闲连接)"""
+        self._slots.acquire()
+        while True:
+            try:
+                connection, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_connection(), False
+            if time.monotonic() - last_used < self.idle_timeout:
+                return connection, True
+            # 空闲过久的连接大概率已被服务端断开，直接丢弃
+            connection.close()
+
+    def _release(self, connection, reusable: bool):
+        """归还连接，不可复用的连接直接关闭"""
+        if reusable:
+            self._idle.put((connection, time.monotonic()))
+        else:
+            connection.close()
+        self._slots.release()
+
+    def request(self, method: str, path: str, body: str = None, headers: Dict = None) -> Tuple[int, bytes]:
+        """发送请求并返回 (状态码, 响应体)"""
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except self.STALE_ERRORS:
+                self._release(connection, False)
+                if reused:
+                    logger.debug(f"连接已失效，重新连接 - 方法: {method}, 路径: {path}")
+                    continue
+                raise
+            except BaseException:
+                self._release(connection, False)
+                raise
+            self._release(connection, not response.will_close)
+            return response.status, data
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+
+
+class AsyncConnectionPool:
+    """
+    基于 asyncio 的HTTP(S)长连接池，仅使用标准库，按 HTTP/1.1 收发请求。
+    需在事件循环内创建和使用
+    """
+
+    # 复用空闲连接时出现这些错误，说明连接已被服务端关闭，可以换新连接重发
+    STALE_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+    def __init__(self, base_url: str, max_size: int = 4, timeout: float = 30, idle_timeout: float = 60):
+        self.https, self.host, self.port = parse_base_url(base_url)
+        default_port = 443 if self.https else 80
+        self.host_header = self.host if self.port == default_port else f"{self.host}:{self.port}"
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._slots = asyncio.Semaphore(max(1, max_size))
+        # (reader, writer, 最后使用时间)，后进先出以优先复用最近使用的连接
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = []
+        self._ssl_context = ssl.create_default_context() if self.https else None
+        logger.info(f"创建异步连接池 - 主机: {self.host}, 端口: {self.port}, 连接数: {max_size}, 超时: {timeout}秒")
+
+    async def _acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """取得一个连接，返回 (reader, writer, 是否为复用的空闲连接)"""
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.idle_timeout and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self._ssl_context)
+        return reader, writer, False
+
+    async def _exchange(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                        body: str = None, headers: Dict = None) -> Tuple[int, bytes, bool]:
+        """在一个连接上完成一次请求，返回 (状态码, 响应体, 是否需要关闭连接)"""
+        payload = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host_header}", "Accept-Encoding: identity"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        if payload or method in ("POST", "PUT"):
+            lines.append(f"Content-Length: {len(payload)}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + payload)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("连接已被服务端关闭")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        will_close = version == "HTTP/1.0" or response_headers.get("connection", "").lower() == "close"
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # 跳过 trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in response_headers:
+            data = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await reader.read()
+            will_close = True
+        return int(status), data, will_close
+
+    async def request(self, method: str, path: str, body: str = None, headers: Dict = None) -> Tuple[int, bytes]:
+        """发送请求并返回 (状态码, 响应体)，超时抛出 asyncio.TimeoutError"""
+        async with self._slots:
+            while True:
+                reader, writer, reused = await asyncio.wait_for(self._acquire(), self.timeout)
+                try:
+                    status, data, will_close = await asyncio.wait_for(
+                        self._exchange(reader, writer, method, path, body, headers), self.timeout)
+                except self.STALE_ERRORS:
+                    writer.close()
+                    if reused:
+                        logger.debug(f"连接已失效，重新连接 - 方法: {method}, 路径: {path}")
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if will_close:
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer, time.monotonic()))
+                return status, data
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        while self._idle:
+            _, writer, _ = self._idle.pop()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发控制：请求正常时每完成约一个窗口（当前并发数）的请求并发数加 1，
+    遇到限流、服务端错误（包括响应体中的存储、驱动错误）时并发数减半，延迟明显升高时并发数减 1
+    """
+
+    # Alist 把后端网盘的限流错误放在响应消息中
+    THROTTLE_PATTERN = re.compile(r"too many requests|rate limit|频繁|限流", re.IGNORECASE)
+    # 路径不存在、文件已存在等是探测请求的正常结果，与服务端负载无关
+    REJECTED_PATTERN = re.compile(r"not found|not exist|exists", re.IGNORECASE)
+
+    def __init__(self, maximum: int, initial: int = 1, minimum: int = 1,
+                 decrease_factor: float = 0.5, latency_factor: float = 3.0):
+        self.maximum = max(1, int(maximum))
+        self.minimum = max(1, min(int(minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self._limit = float(min(max(int(initial), self.minimum), self.maximum))
+        # 请求延迟的指数加权平均和观察到的最低值
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        # 降低并发后的冷却截止时间，避免同一波失败的请求连续降低并发
+        self._hold_until = 0.0
+        self._in_flight = 0
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @classmethod
+    def classify(cls, status: Optional[int], result: Optional[Dict]) -> str:
+        """
+        把一次请求的结果分为 ok / throttled / error / rejected，status 为 None 表示连接失败或超时。
+        响应体中的错误码: 限流为 throttled，路径不存在、文件已存在等为 rejected，其余存储、驱动错误为 error
+        """
+        if status is None:
+            return "error"
+        if status == 429:
+            return "throttled"
+        if status >= 500:
+            return "error"
+        if result and result.get("code") != 200:
+            message = str(result.get("message") or "")
+            if result.get("code") == 429 or cls.THROTTLE_PATTERN.search(message):
+                return "throttled"
+            if result.get("code") in (400, 401, 403, 404) or cls.REJECTED_PATTERN.search(message):
+                return "rejected"
+            return "error"
+        return "ok"
+
+    def try_acquire(self) -> bool:
+        """当前并发未达到上限时占用一个名额"""
+        with self._lock:
+            if self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def acquire(self):
+        """占用一个名额，达到上限时等待"""
+        with self._condition:
+            self._condition.wait_for(self.try_acquire)
+
+    def release(self, latency: float, outcome: str):
+        """释放名额并根据请求结果调整并发数"""
+        with self._condition:
+            self._in_flight -= 1
+            self.record(latency, outcome)
+            self._condition.notify_all()
+
+    def record(self, latency: float, outcome: str):
+        with self._lock:
+            now = time.monotonic()
+            old_limit = self.limit
+            # 被拒绝的请求不能说明服务端能承受更高并发，也不是拥塞信号，不调整并发数
+            if outcome == "rejected":
+                return
+            if outcome != "ok":
+                if now >= self._hold_until:
+                    self._limit = max(self.minimum, self._limit * self.decrease_factor)
+                    self._hold_until = now + max(self._latency or latency, 1.0)
+                    reason = "被限流" if outcome == "throttled" else "失败"
+                    logger.warning(f"自适应并发：请求{reason}，并发数 {old_limit} -> {self.limit}")
+                return
+
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self._baseline = self._latency if self._baseline is None else min(self._baseline, self._latency)
+            if self._latency > max(self._baseline * self.latency_factor, self._baseline + 0.5):
+                if now >= self._hold_until and self._limit > self.minimum:
+                    self._limit = max(self.minimum, self._limit - 1)
+                    self._hold_until = now + self._latency
+                    logger.info(f"自适应并发：平均延迟 {self._latency:.2f} 秒明显高于基线 {self._baseline:.2f} 秒，"
+                                f"并发数 {old_limit} -> {self.limit}")
+                return
+
+            self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            if self.limit != old_limit:
+                logger.info(f"自适应并发：请求正常，并发数 {old_limit} -> {self.limit}")
+
+
+class RetryPolicy:
     """
-    解析时间字符串，如果是UTC格式（包含'Z'）则加8小时
+    请求重试策略：按失败原因分类判断是否重试，带抖动的指数退避，整次同步共享重试预算。
+    幂等的查询、创建目录请求可以重试所有临时错误；复制、移动、删除等请求只在确认服务端未处理时重试，
+    批量操作失败后由调用方重新获取目录确认，只重发尚未完成的项目
     """
-    iso_8601_pattern = r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(\.\d+)?([+-]\d{2}:\d{2}|Z)?'
-    match_iso = re.match(iso_8601_pattern, date_str)
-    if match_iso:
-        year, month, day, hour, minute, second, microsecond, timezone = match_iso.groups()
-        if microsecond:
-            microsecond = int(float(microsecond) * 1000000)
+
+    IDEMPOTENT_PATHS = ("/api/fs/list", "/api/fs/get", "/api/fs/mkdir", "/api/fs/remove_empty_directory",
+                        "/api/auth/login", "/api/admin/setting/list", "/api/admin/storage/list",
+                        "/api/admin/task/copy/undone", "/api/admin/task/copy/done")
+    TRANSIENT_ERRORS = (TimeoutError, socket.timeout, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        ConnectionError, http.client.HTTPException, socket.gaierror)
+    # 请求尚未到达服务端，非幂等请求也可以安全重发
+    UNSENT_ERRORS = (ConnectionRefusedError, socket.gaierror)
+    # 响应体中重试也不会成功的错误：存储不存在、未登录、权限不足（Alist 多以 code 500 返回驱动错误）
+    PERMANENT_PATTERN = re.compile(r"storage not found|permission|denied|forbidden|unauthorized|not allowed",
+                                   re.IGNORECASE)
+
+    def __init__(self, max_retries: int = 3, budget: int = 100, base_delay: float = 0.5, max_delay: float = 30):
+        self.max_retries = max(0, int(max_retries))
+        self.budget = max(0, int(budget))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._remaining = self.budget
+        self._exhausted_logged = False
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """每次同步开始时恢复重试预算"""
+        with self._lock:
+            self._remaining = self.budget
+            self._exhausted_logged = False
+
+    def classify(self, status: Optional[int], result: Optional[Dict],
+                 error: Optional[BaseException]) -> Tuple[Optional[str], bool]:
+        """返回 (可重试的失败原因, 服务端是否确定未处理)，不可重试时原因为 None"""
+        if status == 429 or (result and AdaptiveConcurrency.classify(status, result) == "throttled"):
+            return "被限流", True
+        if status is not None and status >= 500:
+            # 503 通常由网关在转发前直接返回
+            return f"服务端错误 {status}", status == 503
+        if isinstance(error, self.UNSENT_ERRORS):
+            return "连接失败", True
+        if isinstance(error, (TimeoutError, socket.timeout, asyncio.TimeoutError)):
+            return "超时", False
+        if isinstance(error, self.TRANSIENT_ERRORS):
+            return "连接中断", False
+        return None, False
+
+    def classify_response(self, result: Optional[Dict]) -> Tuple[Optional[str], bool]:
+        """
+        批量操作失败响应的 (可重试的失败原因, 是否为临时错误)，永久错误时原因为 None。
+        没有响应（请求失败）、限流和服务端错误为临时错误，退避后重新确认再重发；
+        路径不存在、文件已存在可能是上次请求已生效，只需重新确认目录；存储不存在、权限不足等不重试
+        """
+        if result is None:
+            return "请求失败", True
+        code = result.get("code")
+        if code in (400, 401, 403) or self.PERMANENT_PATTERN.search(str(result.get("message") or "")):
+            return None, False
+        # HTTP 层的状态码已由 _make_request 处理，这里只看响应体
+        if AdaptiveConcurrency.classify(200, result) == "rejected":
+            return "需要重新确认", False
+        reason, _ = self.classify(code if isinstance(code, int) else None, result, None)
+        return reason, reason is not None
+
+    def allow(self, path: str, attempt: int, safe: bool) -> bool:
+        """判断是否重试并占用一次预算"""
+        if attempt >= self.max_retries:
+            return False
+        if not safe and path.split("?")[0] not in self.IDEMPOTENT_PATHS:
+            return False
+        with self._lock:
+            if self._remaining <= 0:
+                if not self._exhausted_logged:
+                    logger.warning(f"本次同步的重试预算 {self.budget} 次已用完，后续失败的请求不再重试")
+                    self._exhausted_logged = True
+                return False
+            self._remaining -= 1
+            return True
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CopyTaskIndex:
+    """未完成复制任务的哈希索引，按 (源目录, 目标目录, 文件名) 判断文件是否已在复制队列中"""
+
+    # Alist 复制任务名称格式: copy [源存储挂载路径](源路径) to [目标存储挂载路径](目标目录)
+    TASK_NAME_PATTERN = re.compile(r"^copy \[(.*?)\]\((.*)\) to \[(.*?)\]\((.*)\)$")
+
+    def __init__(self, task_names: List[str] = None):
+        self.keys: Set[Tuple[str, str, str]] = set()
+        # 无法解析的任务名称，沿用子串匹配
+        self.unparsed: List[str] = []
+        for name in task_names or []:
+            key = self.parse(name)
+            if key:
+                self.keys.add(key)
+            else:
+                self.unparsed.append(name.replace("](", ""))
+
+    @staticmethod
+    def _join(mount_path: str, path: str) -> str:
+        return f"{mount_path}/{path}".replace('//', '/').replace('//', '/').rstrip('/') or '/'
+
+    @classmethod
+    def parse(cls, task_name: str) -> Optional[Tuple[str, str, str]]:
+        """解析任务名称为 (源目录, 目标目录, 文件名)"""
+        match = cls.TASK_NAME_PATTERN.match(task_name)
+        if not match:
+            return None
+        src_mount, src_path, dst_mount, dst_path = match.groups()
+        src_dir, _, name = cls._join(src_mount, src_path).rpartition('/')
+        return src_dir or '/', cls._join(dst_mount, dst_path), name
+
+    def contains(self, src_dir: str, dst_dir: str, name: str) -> bool:
+        """文件是否在未完成的复制任务中"""
+        if (src_dir.rstrip('/') or '/', dst_dir.rstrip('/') or '/', name) in self.keys:
+            return True
+        if self.unparsed:
+            src_path = f"{src_dir}/{name}".replace('//', '/')
+            return any(src_dir in task and dst_dir in task and src_path in task for task in self.unparsed)
+        return False
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self.unparsed)
+
+
+class MountIndex:
+    """存储挂载路径的前缀索引，按路径逐级向上查找最长匹配的挂载路径"""
+
+    def __init__(self, mount_paths: List[str]):
+        self.mount_paths = {path.rstrip('/') or '/' for path in mount_paths}
+
+    def resolve(self, path: str) -> Optional[str]:
+        """返回路径所属的挂载路径"""
+        path = path.rstrip('/') or '/'
+        while True:
+            if path in self.mount_paths:
+                return path
+            if path == '/':
+                return None
+            path = path.rsplit('/', 1)[0] or '/'
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    把 glob 转换为正则：* 和 ? 不跨越目录层级，** 匹配任意层级，[...] 为字符集合（[!...] 取反）
+    """
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
         else:
-            microsecond = 0
-        dt = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond)
-        if timezone == "Z":
-            dt = dt + timedelta(hours=8)  # UTC时间加8小时
-        elif timezone:
-            # 处理其他时区偏移量
-            sign = 1 if timezone[0] == "+" else -1
-            hours = int(timezone[1:3])
-            minutes = int(timezone[4:6])
-            offset = timedelta(hours=sign * hours, minutes=sign * minutes)
-            dt = dt - offset
-        return dt
-    return None
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+
+class PathFilter:
+    """
+    目录的包含/排除规则，在列举目录之前判断，被排除的目录连同整个子树都不会被列举。
+    以 / 开头的规则从根目录匹配完整路径，其余规则匹配同步根目录之下的任意层级，根目录之上的目录名不参与匹配；
+    规则匹配的目录及其所有子目录都被排除。
+    不含通配符的绝对路径放入路径前缀树，单级目录名放入名称集合，其余规则按是否以 / 开头各合并为一个正则，
+    规则再多每个目录也只需一次前缀树查找和一次正则匹配。
+    包含规则不为空时只遍历包含目录及通向它们的上级目录，上级目录中的文件不同步
+    """
+
+    WILDCARDS = re.compile(r'[*?\[]')
+
+    def __init__(self, exclude_rules: Iterable[str] = None, include_rules: Iterable[str] = None, root: str = "/"):
+        self.root = root
+        self._root_segments = self._segments(root)
+        self.exclude_rules = self._normalize(exclude_rules)
+        self.include_rules = self._normalize(include_rules)
+        self._exclude_trie: Dict = {}
+        self._exclude_names: Set[str] = set()
+        absolute, relative = [], []
+        for rule in self.exclude_rules:
+            if rule.startswith("/") and not self.WILDCARDS.search(rule):
+                self._insert(self._exclude_trie, rule)
+            elif "/" not in rule and not self.WILDCARDS.search(rule):
+                self._exclude_names.add(rule)
+            elif rule.startswith("/"):
+                absolute.append(glob_to_regex(rule))
+            else:
+                # 相对规则本身就匹配任意层级，开头的 **/ 可以省略
+                while rule.startswith("**/"):
+                    rule = rule[3:]
+                relative.append(glob_to_regex(rule))
+        # 命中的目录及其子目录都算命中，所以只需匹配到层级边界
+        self._exclude_absolute = re.compile(f"(?:{'|'.join(absolute)})(?:/|$)") if absolute else None
+        self._exclude_relative = re.compile(f"(?:^|/)(?:{'|'.join(relative)})(?:/|$)") if relative else None
+
+        # 包含规则：前缀树中的终点为包含目录，通配规则只取通配符之前的部分作为前缀，再用正则精确判断
+        self._include_trie: Dict = {}
+        # 通配规则 (各层级的模式, 整条规则的正则, 是否为相对规则)，相对规则匹配相对同步根目录的路径
+        self._include_globs: List[Tuple[List[Pattern[str]], Optional[Pattern[str]], bool]] = []
+        for rule in self.include_rules:
+            relative_rule = not rule.startswith("/")
+            if relative_rule:
+                rule = "/**/" + rule
+            if not self.WILDCARDS.search(rule):
+                self._insert(self._include_trie, rule)
+                continue
+            segments = self._segments(rule)
+            segment_patterns = [None if segment == "**" else re.compile(glob_to_regex(segment))
+                                for segment in segments]
+            self._include_globs.append((segment_patterns, re.compile(f"{glob_to_regex(rule)}(?:/|$)"), relative_rule))
+
+    def rooted(self, root: str) -> "PathFilter":
+        """返回以 root 为同步根目录的新规则"""
+        if root == self.root:
+            return self
+        return PathFilter(self.exclude_rules, self.include_rules, root)
+
+    @staticmethod
+    def _normalize(rules: Optional[Iterable[str]]) -> List[str]:
+        normalized = []
+        for rule in rules or []:
+            rule = rule.strip()
+            if rule and rule != "/":
+                normalized.append(rule.rstrip("/"))
+        return normalized
+
+    @staticmethod
+    def _segments(path: str) -> List[str]:
+        return [segment for segment in path.split("/") if segment]
+
+    def _relative_segments(self, segments: List[str]) -> List[str]:
+        """去掉同步根目录部分的路径层级，不在根目录之下的路径原样返回"""
+        depth = len(self._root_segments)
+        if depth and segments[:depth] == self._root_segments:
+            return segments[depth:]
+        return segments
+
+    def _insert(self, trie: Dict, path: str):
+        node = trie
+        for segment in self._segments(path):
+            node = node.setdefault(segment, {})
+        node[None] = True
+
+    def excluded(self, path: str) -> bool:
+        """目录是否被排除规则命中（包括位于被排除目录之下）"""
+        segments = self._segments(path)
+        relative = self._relative_segments(segments)
+        if self._exclude_names and not self._exclude_names.isdisjoint(relative):
+            return True
+        node = self._exclude_trie
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                return True
+        normalized = "/" + "/".join(segments)
+        if self._exclude_absolute is not None and self._exclude_absolute.match(normalized):
+            return True
+        return (self._exclude_relative is not None
+                and self._exclude_relative.search("/" + "/".join(relative)) is not None)
+
+    def covers(self, path: str) -> bool:
+        """目录中的文件是否在包含范围内"""
+        if not self.include_rules:
+            return True
+        segments = self._segments(path)
+        node = self._include_trie
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                return True
+        normalized = "/" + "/".join(segments)
+        relative = "/" + "/".join(self._relative_segments(segments))
+        return any(regex.match(relative if relative_rule else normalized)
+                   for _, regex, relative_rule in self._include_globs)
+
+    def _leads_to_include(self, segments: List[str]) -> bool:
+        """目录是否可能是某个包含目录的上级"""
+        node = self._include_trie
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                break
+        else:
+            return True
+        relative = self._relative_segments(segments)
+        for segment_patterns, _, relative_rule in self._include_globs:
+            for i, segment in enumerate(relative if relative_rule else segments):
+                if i >= len(segment_patterns):
+                    break
+                if segment_patterns[i] is None:
+                    return True
+                if not segment_patterns[i].fullmatch(segment):
+                    break
+            else:
+                return True
+        return False
+
+    def visit(self, path: str) -> bool:
+        """是否需要列举该目录"""
+        if self.excluded(path):
+            return False
+        return self.covers(path) or self._leads_to_include(self._segments(path))
+
+
+SIZE_UNITS = {"": 1, "B": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([smhdw])')
+
+
+def parse_size(value: Optional[str]) -> Optional[int]:
+    """解析文件大小，支持 K/M/G/T 单位（1024 进制），如 500K、1.5G，为空时返回 None"""
+    if value is None or not str(value).strip():
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?', str(value).strip().upper())
+    if not match:
+        raise ValueError(f"无法解析的文件大小: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_time_bound(value: Optional[str], now: datetime = None) -> Optional[datetime]:
+    """解析时间条件，支持 ISO 8601 时间、日期（如 2024-01-01）和相对当前的时长（如 30d、12h），为空时返回 None"""
+    if value is None or not str(value).strip():
+        return None
+    text = str(value).strip()
+    match = DURATION_PATTERN.fullmatch(text.lower())
+    if match:
+        now = now or datetime.now(timezone.utc)
+        return now - timedelta(seconds=float(match.group(1)) * DURATION_UNITS[match.group(2)])
+    parsed = parse_time_and_adjust_utc(text)
+    if parsed is None:
+        raise ValueError(f"无法解析的时间: {value}")
+    return parsed
+
+
+class FileFilter:
+    """
+    文件过滤条件：大小范围、修改时间范围、扩展名白名单/黑名单和文件名正则。
+    只使用列举结果中的名称、大小和修改时间在内存中判断，不产生额外请求；多个正则合并为一个分支表达式，匹配任意一个即同步
+    """
+
+    def __init__(self, min_size: int = None, max_size: int = None, modified_after: datetime = None,
+                 modified_before: datetime = None, include_extensions: Iterable[str] = None,
+                 exclude_extensions: Iterable[str] = None, patterns: Iterable[Union[str, Pattern[str]]] = None,
+                 time_bounds: Tuple[Optional[str], Optional[str]] = None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        # 修改时间条件的原始写法，距今时长（如 30d）按原样参与摘要，不随解析时刻变化
+        self.time_bounds = time_bounds or (modified_after.isoformat() if modified_after else None,
+                                           modified_before.isoformat() if modified_before else None)
+        self.include_extensions = self._extensions(include_extensions)
+        self.exclude_extensions = self._extensions(exclude_extensions)
+        # 已编译的正则原样保留，不丢失编译时的标志
+        self.patterns: List[Union[str, Pattern[str]]] = [p for p in patterns or [] if p]
+        self._pattern = None
+        self._pattern_list: List[Pattern[str]] = []
+        if len(self.patterns) == 1:
+            self._pattern = re.compile(self.patterns[0])
+        elif self.patterns and all(isinstance(p, str) for p in self.patterns):
+            try:
+                self._pattern = re.compile("|".join(f"(?:{p})" for p in self.patterns))
+            except re.error:
+                # 含全局标志（如 (?i)）的表达式无法合并，逐个匹配
+                self._pattern_list = [re.compile(p) for p in self.patterns]
+        elif self.patterns:
+            # 已编译的正则合并后会丢失编译时的标志，逐个匹配
+            self._pattern_list = [re.compile(p) for p in self.patterns]
+
+    @staticmethod
+    def _extensions(extensions: Optional[Iterable[str]]) -> Set[str]:
+        if isinstance(extensions, str):
+            extensions = extensions.split(",")
+        return {ext.strip().lstrip(".").lower() for ext in extensions or [] if ext.strip().lstrip(".")}
+
+    @classmethod
+    def from_env(cls, environ: Dict[str, str] = None) -> "FileFilter":
+        """从 FILTER_* 环境变量创建，配置错误时抛出 ValueError"""
+        environ = os.environ if environ is None else environ
+        after = (environ.get("FILTER_MODIFIED_AFTER") or "").strip() or None
+        before = (environ.get("FILTER_MODIFIED_BEFORE") or "").strip() or None
+        return cls(min_size=parse_size(environ.get("FILTER_MIN_SIZE")),
+                   max_size=parse_size(environ.get("FILTER_MAX_SIZE")),
+                   modified_after=parse_time_bound(after),
+                   modified_before=parse_time_bound(before),
+                   include_extensions=environ.get("FILTER_INCLUDE_EXTENSIONS"),
+                   exclude_extensions=environ.get("FILTER_EXCLUDE_EXTENSIONS"),
+                   time_bounds=(after, before))
+
+    @property
+    def relative_time(self) -> bool:
+        """修改时间条件是否使用距今时长，范围随时间推移变化"""
+        return any(bound and DURATION_PATTERN.fullmatch(bound.lower()) for bound in self.time_bounds)
+
+    def with_patterns(self, patterns: Iterable[Union[str, Pattern[str]]]) -> "FileFilter":
+        """返回追加了文件名正则的新过滤条件"""
+        return FileFilter(self.min_size, self.max_size, self.modified_after, self.modified_before,
+                          self.include_extensions, self.exclude_extensions, self.patterns + list(patterns),
+                          self.time_bounds)
+
+    def match_name(self, name: str) -> bool:
+        if self._pattern_list:
+            return any(pattern.match(name) for pattern in self._pattern_list)
+        return self._pattern is None or self._pattern.match(name) is not None
+
+    def reject_reason(self, item: Dict) -> Optional[str]:
+        """不满足过滤条件时返回原因，满足时返回 None"""
+        name = item.get("name") or ""
+        if self.include_extensions or self.exclude_extensions:
+            extension = name.rsplit(".", 1)[1].lower() if "." in name else ""
+            if self.include_extensions and extension not in self.include_extensions:
+                return "扩展名不在同步范围内"
+            if extension in self.exclude_extensions:
+                return "扩展名已排除"
+        size = item.get("size") or 0
+        if self.min_size is not None and size < self.min_size:
+            return "文件小于最小大小"
+        if self.max_size is not None and size > self.max_size:
+            return "文件大于最大大小"
+        if self.modified_after is not None or self.modified_before is not None:
+            modified = parse_time_and_adjust_utc(item.get("modified"))
+            if modified is not None:
+                if self.modified_after is not None and modified < self.modified_after:
+                    return "修改时间早于同步范围"
+                if self.modified_before is not None and modified > self.modified_before:
+                    return "修改时间晚于同步范围"
+        if not self.match_name(name):
+            return "不符合正则表达式"
+        return None
+
+    def fingerprint(self) -> List:
+        """影响同步结果的条件摘要（不含正则表达式），未设置任何条件时为空"""
+        values = [self.min_size, self.max_size, self.time_bounds[0], self.time_bounds[1],
+                  sorted(self.include_extensions), sorted(self.exclude_extensions)]
+        return values if any(values) else []
+
+
+class DirectoryBatch:
+    """单个目录内待批量提交的复制和删除操作"""
+
+    def __init__(self, src_dir: str, dst_dir: str):
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        # 新文件，直接复制
+        self.copy_names: List[str] = []
+        # 已变更文件，先删除目标再复制
+        self.replace_names: List[str] = []
+        # 待复制和待替换文件的总大小（字节）
+        self.copy_bytes = 0
+        self.replace_bytes = 0
+        # 移动模式下目标已存在的文件，删除源文件
+        self.remove_source_names: List[str] = []
+        # 替换已确认完成后残留的旧文件备份
+        self.remove_backup_names: List[str] = []
+        # 需要继续遍历的子目录 (源目录项目, 目标目录项目)，目标目录不存在时为 None
+        self.sub_directories: List[Tuple[Dict, Optional[Dict]]] = []
+        # 已提交的操作数
+        self.flushed = 0
+        # 同步删除是否处理了目标目录的差异项
+        self.deleted = False
+        # 源目录列举失败，本层级的比较结果不可信
+        self.listing_failed = False
+        # 排除目录，未做任何处理
+        self.excluded = False
+        # 增量同步中源目录列表与上次同步一致，未比较本层文件
+        self.unchanged = False
+        # 源目录列表摘要，只在增量同步且列举完整时计算
+        self.src_digest: Optional[str] = None
+        # 源目录列举到的项目数和已删除的源文件数，用于判断移动模式下源目录是否已清空
+        self.item_count = 0
+        self.removed_source_count = 0
+
+    def __len__(self) -> int:
+        return (len(self.copy_names) + len(self.replace_names) + len(self.remove_source_names)
+                + len(self.remove_backup_names))
+
+    @property
+    def changed(self) -> bool:
+        """本层级是否产生了任何变更"""
+        return bool(self.flushed or len(self) or self.deleted)
+
+    @property
+    def emptied(self) -> bool:
+        """源目录的文件已全部删除，只剩子目录"""
+        return (not self.excluded and not self.listing_failed
+                and self.item_count == self.removed_source_count + len(self.sub_directories))
+
+    def clear(self, include_source_removal: bool = True):
+        """提交成功后清空已提交的操作"""
+        self.flushed += len(self.copy_names) + len(self.replace_names) + len(self.remove_backup_names)
+        self.copy_names, self.replace_names, self.remove_backup_names = [], [], []
+        self.copy_bytes, self.replace_bytes = 0, 0
+        if include_source_removal:
+            self.flushed += len(self.remove_source_names)
+            self.removed_source_count += len(self.remove_source_names)
+            self.remove_source_names = []
+
+
+class PlanOperation:
+    """同步计划中的一项操作，同一目录层级内的同类项目合并为一项"""
+
+    # mkdir: 创建目标目录; copy: 复制新文件; replace: 删除目标文件后重新复制;
+    # remove_source: 删除源文件（移动模式）; delete: 删除目标多余项目; trash: 目标多余项目移动到回收站;
+    # remove_empty: 删除源目录下已清空的子目录（移动模式）; remove_backup: 删除替换已确认完成的旧文件备份
+    ACTIONS = ("mkdir", "copy", "replace", "remove_source", "delete", "trash", "remove_empty", "remove_backup")
+
+    def __init__(self, action: str, src_dir: str, dst_dir: str, names: List[str] = None, trash_dir: str = None,
+                 size: int = 0):
+        if action not in self.ACTIONS:
+            raise ValueError(f"未知的计划操作: {action}")
+        self.action = action
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        self.names = list(names or [])
+        self.trash_dir = trash_dir
+        # copy/replace 涉及文件的总大小（字节）
+        self.size = size
+
+    def to_dict(self) -> Dict:
+        data = {"action": self.action, "src_dir": self.src_dir, "dst_dir": self.dst_dir}
+        if self.names:
+            data["names"] = self.names
+        if self.trash_dir:
+            data["trash_dir"] = self.trash_dir
+        if self.size:
+            data["size"] = self.size
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PlanOperation":
+        return cls(data.get("action"), data.get("src_dir"), data.get("dst_dir"), data.get("names"),
+                   data.get("trash_dir"), data.get("size") or 0)
+
+    @staticmethod
+    def pair(operations: List["PlanOperation"]) -> Iterator[Tuple["PlanOperation", Optional["PlanOperation"]]]:
+        """按顺序返回 (操作, 可合并的复制操作)，紧随 replace 的同目录 copy 与其合并为一次复制请求"""
+        i = 0
+        while i < len(operations):
+            operation, merged = operations[i], None
+            if (operation.action == "replace" and i + 1 < len(operations)
+                    and operations[i + 1].action == "copy"
+                    and (operations[i + 1].src_dir, operations[i + 1].dst_dir) == (operation.src_dir, operation.dst_dir)):
+                merged = operations[i + 1]
+                i += 1
+            yield operation, merged
+            i += 1
+
+
+class DirectoryNode:
+    """遍历中的目录节点，子目录全部完成后（后序）汇总子树结果"""
+
+    def __init__(self, src_dir: str, dst_dir: str, parent: "DirectoryNode" = None,
+                 src_entry: Dict = None, dst_entry: Dict = None):
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        self.parent = parent
+        self.src_entry = src_entry
+        self.dst_entry = dst_entry
+        # 增量同步中目录元数据与上次同步一致，源目录列表也一致时不列举目标目录、不比较本层文件
+        self.unchanged = False
+        # 源目录列表摘要，子树一致时写入增量记录
+        self.src_digest: Optional[str] = None
+        # 自身任务和尚未完成的子目录数
+        self.remaining = 1
+        # 子树本次是否无需任何变更
+        self.clean = True
+        # 移动模式下判断源目录是否已清空：自身文件是否已全部删除、子目录数和已清空的子目录名
+        self.files_cleared = False
+        self.sub_directory_count = 0
+        self.empty_children: List[str] = []
+
+
+class DirectoryWalk:
+    """一次目录遍历的后序汇总状态，线程池引擎和 asyncio 引擎共用"""
+
+    def __init__(self, src_dir: str, dst_dir: str, records: Dict[Tuple[str, str], Tuple] = None,
+                 full_scan: bool = False):
+        self.root = DirectoryNode(src_dir, dst_dir)
+        # 增量记录 (源路径, 目标路径) -> 元数据
+        self.records = records or {}
+        # 增量同步中本次为定期完整遍历，不使用增量记录
+        self.full_scan = full_scan
+        # 子树已完成的目录，按本次是否无需变更分组，用于更新增量记录
+        self.clean_nodes: List[DirectoryNode] = []
+        self.dirty_nodes: List[DirectoryNode] = []
+        self.skipped = 0
+        # 已清空的最上层源目录，按父目录分组 (源父目录, 目标父目录, 目录名列表)，删除前逐个重新确认为空
+        self.empty_directories: List[Tuple[str, str, List[str]]] = []
+
+    def complete(self, node: DirectoryNode):
+        """目录自身及全部子目录完成后，向上汇总结果"""
+        while node is not None:
+            node.remaining -= 1
+            if node.remaining:
+                return
+            if node.src_entry is not None and node.dst_entry is not None:
+                (self.clean_nodes if node.clean else self.dirty_nodes).append(node)
+            empty = node.files_cleared and len(node.empty_children) == node.sub_directory_count
+            if node.parent is not None and empty:
+                node.parent.empty_children.append(node.src_entry["name"])
+            elif node.empty_children:
+                self.empty_directories.append((node.src_dir, node.dst_dir, node.empty_children))
+            if node.parent is not None:
+                node.parent.clean = node.parent.clean and node.clean
+            node = node.parent
+
+    def expand(self, node: DirectoryNode, batch: "DirectoryBatch") -> List[DirectoryNode]:
+        """目录层级处理完成，返回需要继续处理的子目录节点，增量记录未变化的子目录直接跳过"""
+        node.clean = not batch.changed and not batch.listing_failed
+        node.src_digest = batch.src_digest
+        if batch.unchanged:
+            self.skipped += 1
+        node.files_cleared = batch.emptied
+        node.sub_directory_count = len(batch.sub_directories)
+        children = []
+        for src_entry, dst_entry in batch.sub_directories:
+            child = DirectoryNode(f"{node.src_dir}/{src_entry['name']}".replace('//', '/'),
+                                  f"{node.dst_dir}/{src_entry['name']}".replace('//', '/'),
+                                  node, src_entry, dst_entry)
+            node.remaining += 1
+            recorded = self.records.get((child.src_dir, child.dst_dir))
+            # 更深层的变更不会更新上层目录的修改时间，元数据未变化的目录仍要列举源目录，由列表摘要判断本层是否变化
+            if (recorded and recorded[4] and dst_entry is not None
+                    and recorded[:4] == SyncStateIndex.fingerprint(src_entry) + SyncStateIndex.fingerprint(dst_entry)):
+                child.unchanged = True
+            children.append(child)
+        self.complete(node)
+        return children
+
+
+class SourceListingCache:
+    """
+    一个源目录同步到多个目标时共享的源目录列举结果，每个源目录只列举一次。
+    第一个请求的目标负责列举，其余目标等待同一结果（列举失败时得到同一异常），全部目标取用后释放
+    """
+
+    def __init__(self, consumers: int):
+        self.consumers = consumers
+        # 源路径 -> [列举结果 future, 尚未取用的目标数]
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _claim(self, path: str, new_future: Callable[[], Union[Future, asyncio.Future]]):
+        """取用路径的 future，返回 (future, 是否由调用方负责列举)"""
+        with self._lock:
+            entry = self._entries.get(path)
+            owner = entry is None
+            if owner:
+                entry = self._entries[path] = [new_future(), self.consumers]
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._entries[path]
+            return entry[0], owner
+
+    def get(self, path: str, loader: Callable[[], List[Dict]]) -> List[Dict]:
+        future, owner = self._claim(path, Future)
+        if owner:
+            try:
+                future.set_result(loader())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    async def get_async(self, path: str, loader: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        future, owner = self._claim(path, lambda: asyncio.get_running_loop().create_future())
+        if owner:
+            try:
+                future.set_result(await loader())
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+        return await future
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SyncStateIndex:
+    """基于 SQLite 的同步状态索引，记录上次成功同步时已一致的目录元数据"""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    options TEXT NOT NULL,
+                    src_path TEXT NOT NULL,
+                    dst_path TEXT NOT NULL,
+                    src_size INTEGER,
+                    src_modified TEXT,
+                    dst_size INTEGER,
+                    dst_modified TEXT,
+                    synced_at REAL,
+                    src_listing TEXT,
+                    PRIMARY KEY (options, src_path, dst_path)
+                )
+            """)
+            # 旧版本的记录没有源目录列表摘要，补充该列后旧记录不会被视为未变化
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sync_state)")}
+            if "src_listing" not in columns:
+                conn.execute("ALTER TABLE sync_state ADD COLUMN src_listing TEXT")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_full_scan (
+                    options TEXT NOT NULL,
+                    src_path TEXT NOT NULL,
+                    scanned_at REAL,
+                    PRIMARY KEY (options, src_path)
+                )
+            """)
+
+    def load(self, options: str, src_dir: str) -> Dict[Tuple[str, str], Tuple]:
+        """
+        加载源目录下的全部记录，
+        (源路径, 目标路径) -> (源大小, 源修改时间, 目标大小, 目标修改时间, 源目录列表摘要)
+        """
+        prefix = src_dir.rstrip('/') + '/'
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT src_path, dst_path, src_size, src_modified, dst_size, dst_modified, src_listing "
+                "FROM sync_state "
+                "WHERE options = ? AND substr(src_path, 1, ?) = ?",
+                (options, len(prefix), prefix)).fetchall()
+        return {(row[0], row[1]): tuple(row[2:]) for row in rows}
+
+    def last_full_scan(self, options: str, src_dir: str) -> Optional[float]:
+        """源目录上次完整遍历（不跳过任何目录）成功的时间"""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT scanned_at FROM sync_full_scan WHERE options = ? AND src_path = ?",
+                               (options, src_dir)).fetchone()
+        return row[0] if row else None
+
+    def mark_full_scan(self, options: str, src_dir: str):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT OR REPLACE INTO sync_full_scan VALUES (?, ?, ?)", (options, src_dir, time.time()))
+
+    def save(self, options: str, clean: List[DirectoryNode], dirty: List[DirectoryNode]):
+        """一次事务写入：子树已一致的目录记录元数据，其余目录清除旧记录"""
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(options, node.src_dir, node.dst_dir,
+                  node.src_entry.get("size"), node.src_entry.get("modified"),
+                  node.dst_entry.get("size"), node.dst_entry.get("modified"), now, node.src_digest)
+                 for node in clean])
+            conn.executemany(
+                "DELETE FROM sync_state WHERE options = ? AND src_path = ? AND dst_path = ?",
+                [(options, node.src_dir, node.dst_dir) for node in dirty])
+
+    def purge(self, max_age: float):
+        """删除超过 max_age 秒未更新的记录，配置变更后旧配置下的记录不会再被读取"""
+        cutoff = time.time() - max_age
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM sync_state WHERE synced_at < ?", (cutoff,))
+            conn.execute("DELETE FROM sync_full_scan WHERE scanned_at < ?", (cutoff,))
+
+    @staticmethod
+    def fingerprint(entry: Dict) -> Tuple:
+        """目录项目中参与比较的元数据"""
+        return entry.get("size"), entry.get("modified")
+
+    @staticmethod
+    def listing_key(item: Dict) -> str:
+        """源目录列表中参与摘要的项目元数据"""
+        return f"{item.get('name')}\t{bool(item.get('is_dir'))}\t{item.get('size')}\t{item.get('modified')}"
+
+    @staticmethod
+    def listing_digest(keys: Iterable[str]) -> str:
+        """源目录列表的摘要，与列举顺序无关"""
+        return hashlib.sha1("\n".join(sorted(keys)).encode("utf-8")).hexdigest()
 
 
 class AlistSync:
+    # 替换策略 rename 时旧文件改名使用的后缀
+    BACKUP_SUFFIX = ".alist-sync-old"
+    # remove: 先删除目标文件再复制; overwrite: 复制时覆盖目标文件; rename: 旧文件改名备份，确认新文件就位后删除
+    REPLACE_STRATEGIES = ("remove", "overwrite", "rename")
+    # 增量记录超过该天数未更新时删除
+    STATE_MAX_AGE_DAYS = 30
+    # 流式生成计划时缓冲的计划记录数，读取方跟不上时遍历暂停
+    PLAN_QUEUE_SIZE = 1000
+
     def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
                  sync_delete_action: str = "none", exclude_list: List[str] = None, move_file_action: bool = False,
                  regex_patterns_list=None, regex_pattern=None,
-                 task_list: List[str] = None):
+                 task_list: List[str] = None, concurrency: int = 1, request_timeout: float = 30,
+                 batch_size: int = 100, incremental: bool = False, state_db_path: str = None,
+                 page_size: int = 1000, max_copy_tasks: int = 0, adaptive_concurrency: bool = False,
+                 max_retries: int = 3, retry_budget: int = 100, task_name: str = "default",
+                 trace_dir: str = None, mtime_tolerance: float = 0, compare_hash: bool = False,
+                 replace_strategy: str = "remove", include_list: List[str] = None,
+                 file_filter: "FileFilter" = None, progress: Callable[[str, int, int], None] = None,
+                 full_scan_hours: float = 24):
         """初始化AlistSync类"""
         if regex_patterns_list is None:
             regex_patterns_list = []
@@ -93,45 +1499,126 @@ class AlistSync:
         self.token = token  # 添加token属性
         self.sync_delete_action = sync_delete_action.lower()
         self.sync_delete = self.sync_delete_action in ["move", "delete"]
-        self.connection = self._create_connection()
         self.task_list = task_list
-        self.exclude_list = exclude_list
+        self.task_index = CopyTaskIndex(task_list)
+        # 长时间运行时定期刷新未完成任务索引的间隔（秒）
+        self.task_refresh_interval = 60
+        self._task_index_time = time.monotonic()
+        self._task_refresh_lock = threading.Lock()
+        # 同步删除使用的存储挂载索引和已确认存在的回收站目录，每次同步时重置
+        self._mount_index = None
+        self._trash_dirs: Set[str] = set()
+        self._trash_lock = threading.Lock()
+        # 一个源目录同步到多个目标时共享的源目录列举结果，只在 sync_fan_out 期间存在
+        self._source_cache: Optional[SourceListingCache] = None
+        self.exclude_list = exclude_list or []
+        self.include_list = include_list or []
+        self.path_filter = PathFilter(self.exclude_list, self.include_list)
         self.move_file_action = move_file_action
         self.regex_patterns_list = regex_patterns_list
         self.regex_pattern = regex_pattern
-
-    def _create_connection(self) -> Union[http.client.HTTPConnection, http.client.HTTPSConnection]:
-        """创建HTTP(S)连接"""
+        # 文件过滤条件，regex_patterns_list 和 regex_pattern 合并为其中的文件名正则
+        self.file_filter = (file_filter or FileFilter()).with_patterns(
+            list(regex_patterns_list) + ([regex_pattern] if regex_pattern else []))
+        self.concurrency = max(1, int(concurrency or 1))
+        self.request_timeout = request_timeout
+        self.batch_size = max(1, int(batch_size or 1))
+        self.incremental = incremental
+        # 增量同步时每隔多少小时完整遍历一次，0 表示不定期完整遍历
+        self.full_scan_hours = max(0.0, float(full_scan_hours or 0))
+        self.state_db_path = state_db_path or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'data/state/alist_sync_state.db')
+        self._state_index = None
+        self.page_size = max(1, int(page_size or 1))
+        # 未完成复制任务的上限，达到上限时暂停提交新的复制，0 表示不限制
+        self.max_copy_tasks = max(0, int(max_copy_tasks or 0))
+        self.copy_poll_interval = 2
+        self.copy_poll_max_interval = 60
+        # 未完成复制任务数的估计值：最近一次查询结果加上之后提交的数量
+        self._copy_tasks_in_flight = len(task_list or [])
+        self._copy_window_lock = threading.Lock()
+        # 自适应并发开启时，并发数在 1 到 concurrency 之间自动调整
+        self._concurrency_controller = AdaptiveConcurrency(self.concurrency) if adaptive_concurrency else None
+        self.retry_policy = RetryPolicy(max_retries, retry_budget)
+        self._prefetch_executor = None
+        self._prefetch_lock = threading.Lock()
+        # 生成同步计划时接收计划操作，为 None 时操作立即执行
+        self._operation_sink: Optional[Callable[[PlanOperation], None]] = None
+        # 指标中的任务名称
+        self.task_name = task_name or "default"
+        # 进度回调 (动作, 文件数, 字节数)，与指标的文件计数一致，可能在多个线程中调用
+        self.progress = progress
+        # 设置追踪目录时记录各阶段和请求的耗时区间，关闭连接时写入追踪文件
+        self.tracer = SyncTracer(trace_dir, self.task_name) if trace_dir else None
+        # 比较修改时间时允许的误差，吸收存储之间的时钟偏差和时间精度损失
+        self.mtime_tolerance = timedelta(seconds=max(0.0, float(mtime_tolerance or 0)))
+        # 按 Alist 返回的文件哈希判断内容是否变化，两侧没有相同算法的哈希时仍按大小和修改时间判断
+        self.compare_hash = compare_hash
+        self.replace_strategy = (replace_strategy or "remove").lower()
+        if self.replace_strategy not in self.REPLACE_STRATEGIES:
+            raise ValueError(f"未知的替换策略: {replace_strategy}")
+        # 已提交替换、等待确认的文件 (源目录, 目标目录) -> 文件名集合
+        self._pending_backups: Dict[Tuple[str, str], Set[str]] = {}
+        self._backup_lock = threading.Lock()
+        self.connection_pool = self._create_connection_pool()
+
+    def _create_connection_pool(self) -> ConnectionPool:
+        """创建连接池，连接数与并发数一致"""
         try:
-            match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", self.base_url)
-            if not match:
-                raise ValueError("Invalid base URL format")
-
-            host = match.group(1)
-            port_part = match.group(2)
-            port = int(port_part) if port_part else (443 if self.base_url.startswith("https://") else 80)
-
-            logger.info(f"创建连接 - 主机: {host}, 端口: {port}")
-            return (http.client.HTTPSConnection(host, port)
-                    if self.base_url.startswith("https://")
-                    else http.client.HTTPConnection(host, port))
+            return ConnectionPool(self.base_url, max_size=self.concurrency, timeout=self.request_timeout)
         except Exception as e:
             logger.error(f"创建连接失败: {str(e)}")
             raise
 
+    def _count(self, action: str, count: int = 1, size: int = 0):
+        """记录本任务的文件计数和提交复制的字节数，生成计划时不记录"""
+        if self._operation_sink is not None:
+            return
+        metrics.add_files(self.task_name, action, count)
+        metrics.add_bytes_enqueued(self.task_name, size)
+        if self.progress is not None:
+            self.progress(action, count, size)
+
     def _make_request(self, method: str, path: str, headers: Dict = None,
                       payload: str = None) -> Optional[Dict]:
-        """发送HTTP请求并返回JSON响应"""
+        """发送HTTP请求并返回JSON响应，临时错误按重试策略退避重试"""
+        attempt = 0
+        while True:
+            status, result, error = self._send_request(method, path, headers, payload)
+            reason, safe = self.retry_policy.classify(status, result, error)
+            if reason and self.retry_policy.allow(path, attempt, safe):
+                delay = self.retry_policy.backoff(attempt)
+                attempt += 1
+                logger.warning(f"请求{reason}，{delay:.1f} 秒后第 {attempt} 次重试 - 方法: {method}, 路径: {path}")
+                time.sleep(delay)
+                continue
+            if error is not None:
+                logger.error(f"请求失败 - 方法: {method}, 路径: {path}, 状态码: {status}, 错误: {str(error)}")
+                return None
+            return result
+
+    @traced("http", _trace_request, _trace_request_name)
+    def _send_request(self, method: str, path: str, headers: Dict = None,
+                      payload: str = None) -> Tuple[Optional[int], Optional[Dict], Optional[Exception]]:
+        """发送一次请求，返回 (状态码, JSON响应, 异常)"""
+        controller = self._concurrency_controller
+        if controller:
+            controller.acquire()
+        start = time.monotonic()
+        status, result = None, None
         try:
             logger.debug(f"发送请求 - 方法: {method}, 路径: {path}")
-            self.connection.request(method, path, body=payload, headers=headers)
-            response = self.connection.getresponse()
-            result = json.loads(response.read().decode("utf-8"))
+            status, body = self.connection_pool.request(method, path, body=payload, headers=headers)
+            result = json.loads(body.decode("utf-8"))
             logger.debug(f"请求响应: {result}")
-            return result
+            return status, result, None
         except Exception as e:
-            logger.error(f"请求失败 - 方法: {method}, 路径: {path}, 错误: {str(e)}")
-            return None
+            return status, None, e
+        finally:
+            latency, outcome = time.monotonic() - start, AdaptiveConcurrency.classify(status, result)
+            metrics.observe_request(path.split("?", 1)[0], outcome, latency)
+            if controller:
+                controller.release(latency, outcome)
 
     def login(self) -> bool:
         """登录并获取token"""
@@ -209,19 +1696,53 @@ class AlistSync:
         return self._make_request(method, path, headers, payload)
 
     def get_copy_task_undone(self):
-        """获取未完成的复制任务"""
+        """获取未完成的复制任务并重建索引"""
         response = self._task_operation("GET", "copy/undone")
+        self._update_task_index(response)
+        return True
+
+    def _update_task_index(self, response: Optional[Dict]):
+        """根据未完成任务接口的响应重建索引"""
         name_list = []
         if response and response.get("data", []):
-            for item in response["data"]:
-                name = item["name"]
-                try:
-                    result = name.replace("](", "")
-                    name_list.append(result)
-                except IndexError:
-                    print(f"字符串 '{name}' 未找到匹配的切分字符串。")
+            name_list = [item["name"] for item in response["data"] if item.get("name")]
         self.task_list = name_list
-        return True
+        self.task_index = CopyTaskIndex(name_list)
+        self._task_index_time = time.monotonic()
+        self._copy_tasks_in_flight = len(name_list)
+        logger.debug(f"未完成的复制任务: {len(self.task_index)} 个")
+
+    def _copy_window_full(self, count: int) -> bool:
+        """提交 count 个复制任务后是否超过上限，队列为空时总是允许提交，避免单批超过上限时无法推进"""
+        return bool(self._copy_tasks_in_flight) and self._copy_tasks_in_flight + count > self.max_copy_tasks
+
+    def _wait_for_copy_capacity(self, count: int):
+        """未完成的复制任务达到上限时，按指数退避轮询任务队列，直到有空位再提交"""
+        if not self.max_copy_tasks:
+            return
+        with self._copy_window_lock:
+            delay = self.copy_poll_interval
+            while self._copy_window_full(count):
+                self.get_copy_task_undone()
+                if not self._copy_window_full(count):
+                    break
+                logger.info(f"未完成的复制任务 {self._copy_tasks_in_flight} 个，达到上限 {self.max_copy_tasks}，"
+                            f"{delay} 秒后重新检查")
+                time.sleep(delay)
+                delay = min(delay * 2, self.copy_poll_max_interval)
+            self._copy_tasks_in_flight += count
+
+    def _refresh_copy_tasks_if_stale(self):
+        """索引过期时刷新，同一时刻只有一个线程刷新，其余线程继续使用旧索引"""
+        if time.monotonic() - self._task_index_time < self.task_refresh_interval:
+            return
+        if not self._task_refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._task_index_time >= self.task_refresh_interval:
+                self.get_copy_task_undone()
+        finally:
+            self._task_refresh_lock.release()
         # return name_list
 
     def get_copy_task_retry_failed(self) -> List[Dict]:
@@ -236,13 +1757,65 @@ class AlistSync:
 
     def get_directory_contents(self, directory_path: str) -> List[Dict]:
         """获取目录内容"""
-        response = self._directory_operation("list", path=directory_path)
-        return response.get("data", {}).get("content", []) if response else []
+        return self._list_directory(directory_path) or []
+
+    def _list_directory(self, directory_path: str) -> Optional[List[Dict]]:
+        """获取目录内容，请求失败时返回 None 以便与空目录区分"""
+        try:
+            return list(self.iter_directory_contents(directory_path))
+        except AlistAPIError as e:
+            logger.error(str(e))
+            return None
+
+    def _list_page(self, directory_path: str, page: int, per_page: int) -> Tuple[List[Dict], int]:
+        """获取目录的一页内容，返回 (项目列表, 项目总数)"""
+        response = self._directory_operation("list", path=directory_path, page=page, per_page=per_page)
+        if not response or response.get("code") != 200:
+            message = response.get("message") if response else "请求失败"
+            raise AlistAPIError(f"获取目录内容失败: {directory_path}, 第 {page} 页, 错误: {message}")
+        data = response.get("data") or {}
+        return data.get("content") or [], data.get("total") or 0
+
+    def _get_prefetch_executor(self) -> ThreadPoolExecutor:
+        """预取分页使用的线程池"""
+        with self._prefetch_lock:
+            if self._prefetch_executor is None:
+                self._prefetch_executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                             thread_name_prefix="alist-sync-list")
+            return self._prefetch_executor
+
+    def iter_directory_contents(self, directory_path: str, per_page: int = None,
+                                prefetch: bool = True) -> Iterator[Dict]:
+        """
+        分页流式获取目录内容，调用方处理当前页时在后台预取下一页。
+        请求失败时抛出 AlistAPIError
+        """
+        per_page = per_page or self.page_size
+        page, fetched = 1, 0
+        content, total = self._list_page(directory_path, page, per_page)
+        while True:
+            fetched += len(content)
+            # 以已取得数量和总数判断是否还有下一页，服务端限制了每页数量时同样适用
+            has_more = bool(content) and fetched < total
+            next_page = None
+            if has_more and prefetch:
+                next_page = self._get_prefetch_executor().submit(self._list_page, directory_path, page + 1, per_page)
+            yield from content
+            if not has_more:
+                return
+            page += 1
+            content, total = next_page.result() if next_page else self._list_page(directory_path, page, per_page)
+
+    def _iter_source(self, src_dir: str) -> Iterator[Dict]:
+        """遍历源目录内容，多目标同步时各目标共用同一次列举"""
+        if self._source_cache is None:
+            return self.iter_directory_contents(src_dir)
+        return iter(self._source_cache.get(src_dir, lambda: list(self.iter_directory_contents(src_dir))))
 
     def create_directory(self, directory_path: str) -> bool:
         """创建目录"""
         response = self._directory_operation("mkdir", path=directory_path)
-        if response:
+        if response and response.get("code") == 200:
             logger.info(f"文件夹【{directory_path}】创建成功")
             return True
         logger.error("文件夹创建失败")
@@ -251,33 +1824,27 @@ class AlistSync:
     def remove_empty_directory(self, directory_path: str) -> bool:
         """删除空文件夹"""
         response = self._directory_operation("remove_empty_directory", src_dir=directory_path)
-        if response:
+        if response and response.get("code") == 200:
             logger.info(f"删除空文件夹【{directory_path}】成功")
             return True
-        logger.error("删除空文件夹失败")
+        logger.warning(f"删除空文件夹失败: {directory_path} {response.get('message') if response else ''}")
         return False
 
-    # 递归删除空文件夹
-    def _remove_empty_folders(self, base_dir: str, src_dir: str):
-        if base_dir in src_dir and self.is_path_exists(src_dir):
-            src_contents = self.get_directory_contents(src_dir)
-            if src_contents:
-                for item in src_contents:
-                    if item.get('is_dir', False):
-                        name = item.get('name', '未知项目')
-                        src_path = f"{src_dir}/{name}"
-                        self._remove_empty_folders(base_dir, src_path)
-            else:
-                # 文件移动的情况下删除空文件夹
-                if base_dir != src_dir:
-                    # 找到最后一个 / 的索引
-                    last_slash_index = src_dir.rfind('/')
-                    # 分割字符串
-                    remove_dir = src_dir[:last_slash_index]
-                    remove_names = src_dir[last_slash_index + 1:]
-                    self._directory_operation("remove", dir=remove_dir, names=[remove_names])
-                    logger.info(f"删除空文件夹【{src_dir}】成功")
-                    self._remove_empty_folders(base_dir, remove_dir)
+    def _remove_empty_tree(self, path: str) -> bool:
+        """自底向上删除 path 及其下的空目录，每个目录删除前重新列举确认为空，返回 path 是否已删除"""
+        entries = self._list_directory(path)
+        if entries is None:
+            return False
+        sub_directories = [item["name"] for item in entries if item.get("is_dir")]
+        for name in sub_directories:
+            self._remove_empty_tree(f"{path}/{name}")
+        if sub_directories:
+            entries = self._list_directory(path)
+        if entries != []:
+            logger.warning(f"源目录【{path}】不为空或无法确认，保留")
+            return False
+        parent, _, name = path.rpartition("/")
+        return self._batch_operation("remove", [name], dir=parent or "/")
 
     def _copy_item(self, src_dir: str, dst_dir: str, item_name: str) -> bool:
         """复制文件或目录"""
@@ -303,6 +1870,342 @@ class AlistSync:
         logger.error("文件移动失败")
         return False
 
+    def _batch_operation(self, operation: str, names: List[str], **kwargs) -> bool:
+        """按批次大小拆分 names 执行 copy/move/remove 等操作"""
+        for i in range(0, len(names), self.batch_size):
+            chunk = names[i:i + self.batch_size]
+            if operation == "copy":
+                self._wait_for_copy_capacity(len(chunk))
+            if not self._submit_chunk(operation, chunk, **kwargs):
+                return False
+        return True
+
+    def _submit_chunk(self, operation: str, names: List[str], **kwargs) -> bool:
+        """
+        提交一批 copy/move/remove。请求失败时服务端可能已经处理，重新获取相关目录确认后
+        只重发尚未完成的项目；覆盖复制重复提交不影响结果，直接重发
+        """
+        attempt = 0
+        while True:
+            response = self._directory_operation(operation, names=names, **kwargs)
+            if response and response.get("code") == 200:
+                return True
+            message = response.get("message") if response else "请求失败"
+            reason, transient = self.retry_policy.classify_response(response)
+            # 覆盖复制不重新确认目录，只有临时错误值得重发
+            if (reason is None or (not transient and kwargs.get("overwrite"))
+                    or not self.retry_policy.allow(f"/api/fs/{operation}", attempt, True)):
+                logger.error(f"批量操作 {operation} 失败: {kwargs} {names}, 错误: {message}")
+                return False
+            if transient:
+                time.sleep(self.retry_policy.backoff(attempt))
+            attempt += 1
+            if not kwargs.get("overwrite"):
+                if operation == "copy":
+                    self.get_copy_task_undone()
+                directory = self._recheck_directory(operation, **kwargs)
+                names = self._unconfirmed_names(operation, names, self._list_directory(directory), **kwargs)
+                if names is None:
+                    return False
+                if not names:
+                    logger.info(f"批量操作 {operation} 请求失败（{message}），重新确认后均已完成: {kwargs}")
+                    return True
+            logger.warning(f"批量操作 {operation} 请求失败（{message}），第 {attempt} 次重新提交 {len(names)} 项: {kwargs}")
+
+    @staticmethod
+    def _recheck_directory(operation: str, **kwargs) -> str:
+        """确认批量操作结果时需要重新获取的目录：复制看目标目录，移动看源目录，删除看所在目录"""
+        if operation == "copy":
+            return kwargs["dst_dir"]
+        return kwargs["src_dir"] if operation == "move" else kwargs["dir"]
+
+    def _unconfirmed_names(self, operation: str, names: List[str], entries: Optional[List[Dict]],
+                           **kwargs) -> Optional[List[str]]:
+        """
+        根据重新获取的目录内容返回尚未完成的项目，目录获取失败时返回 None。
+        复制: 既不在目标目录也不在复制队列中; 移动、删除: 仍在原目录中
+        """
+        if entries is None:
+            return None
+        existing = {item.get("name") for item in entries}
+        if operation == "copy":
+            return [name for name in names if name not in existing
+                    and not self.task_index.contains(kwargs["src_dir"], kwargs["dst_dir"], name)]
+        return [name for name in names if name in existing]
+
+    @classmethod
+    def backup_name(cls, name: str) -> str:
+        return f"{name}{cls.BACKUP_SUFFIX}"
+
+    @staticmethod
+    def _rename_objects(names: List[str], backup: bool) -> List[Dict]:
+        """文件名与备份名之间的批量改名参数，backup 为 False 时把备份改回原名"""
+        if backup:
+            return [{"src_name": name, "new_name": AlistSync.backup_name(name)} for name in names]
+        return [{"src_name": AlistSync.backup_name(name), "new_name": name} for name in names]
+
+    @staticmethod
+    def _pending_renames(objects: List[Dict], entries: Optional[List[Dict]]) -> Optional[List[Dict]]:
+        """重新获取目录后，返回原名仍在、新名尚不存在的改名项，目录获取失败时返回 None"""
+        if entries is None:
+            return None
+        existing = {item.get("name") for item in entries}
+        return [obj for obj in objects if obj["src_name"] in existing and obj["new_name"] not in existing]
+
+    def _rename_batch(self, dst_dir: str, names: List[str], backup: bool = True) -> bool:
+        """按批次大小批量改名，需要服务端确认成功，失败时重新获取目录后只重发未完成的改名项"""
+        for i in range(0, len(names), self.batch_size):
+            objects, attempt = self._rename_objects(names[i:i + self.batch_size], backup), 0
+            while objects:
+                response = self._directory_operation("batch_rename", src_dir=dst_dir, rename_objects=objects)
+                if response and response.get("code") == 200:
+                    break
+                message = response.get("message") if response else "请求失败"
+                reason, transient = self.retry_policy.classify_response(response)
+                if reason is None or not self.retry_policy.allow("/api/fs/batch_rename", attempt, True):
+                    logger.error(f"批量改名失败: {dst_dir} {message}")
+                    return False
+                if transient:
+                    time.sleep(self.retry_policy.backoff(attempt))
+                attempt += 1
+                objects = self._pending_renames(objects, self._list_directory(dst_dir))
+                if objects is None:
+                    return False
+                logger.warning(f"批量改名失败（{message}），第 {attempt} 次重新提交 {len(objects)} 项: {dst_dir}")
+        return True
+
+    def _register_backups(self, operation: PlanOperation):
+        with self._backup_lock:
+            self._pending_backups.setdefault((operation.src_dir, operation.dst_dir), set()).update(operation.names)
+
+    def _confirmed_backups(self, src_dir: str, dst_dir: str, names: Set[str], entries: Dict[str, Dict]) -> List[str]:
+        """新文件已在目标目录且复制任务已结束的备份名"""
+        return sorted(self.backup_name(name) for name in names
+                      if name in entries and self.backup_name(name) in entries
+                      and not self.task_index.contains(src_dir, dst_dir, name))
+
+    def _confirm_replacements(self):
+        """
+        同步结束时确认替换结果，新文件已就位的旧文件备份被删除。
+        复制任务仍在进行的备份保留，由下次同步确认后删除
+        """
+        with self._backup_lock:
+            pending, self._pending_backups = self._pending_backups, {}
+        if not pending:
+            return
+        self.get_copy_task_undone()
+        kept = 0
+        for (src_dir, dst_dir), names in pending.items():
+            entries = {entry["name"]: entry for entry in self.get_directory_contents(dst_dir)}
+            confirmed = self._confirmed_backups(src_dir, dst_dir, names, entries)
+            kept += len(names) - len(confirmed)
+            if confirmed:
+                self._submit_operations([PlanOperation("remove_backup", src_dir, dst_dir, confirmed)])
+        if kept:
+            logger.info(f"{kept} 个文件的复制任务尚未完成，旧文件备份保留到下次同步确认后删除")
+
+    def _flush_batch(self, batch: DirectoryBatch, include_source_removal: bool = True) -> bool:
+        """
+        批量提交一个目录内登记的操作。
+        源目录仍在分页列举时不删除源文件，避免分页偏移变化导致漏掉项目
+        """
+        if not self._submit_operations(self._batch_plan(batch, include_source_removal)):
+            return False
+        batch.clear(include_source_removal)
+        return True
+
+    @staticmethod
+    def _batch_plan(batch: DirectoryBatch, include_source_removal: bool = True) -> List[PlanOperation]:
+        """把目录批次转换为计划操作"""
+        operations = []
+        if batch.remove_backup_names:
+            operations.append(PlanOperation("remove_backup", batch.src_dir, batch.dst_dir, batch.remove_backup_names))
+        if batch.replace_names:
+            operations.append(PlanOperation("replace", batch.src_dir, batch.dst_dir, batch.replace_names,
+                                            size=batch.replace_bytes))
+        if batch.copy_names:
+            operations.append(PlanOperation("copy", batch.src_dir, batch.dst_dir, batch.copy_names,
+                                            size=batch.copy_bytes))
+        if include_source_removal and batch.remove_source_names:
+            operations.append(PlanOperation("remove_source", batch.src_dir, batch.dst_dir, batch.remove_source_names))
+        return operations
+
+    def _submit_operations(self, operations: List[PlanOperation]) -> bool:
+        """生成同步计划时交给计划输出，否则立即按顺序执行"""
+        if self._operation_sink is not None:
+            for operation in operations:
+                self._operation_sink(operation)
+            return True
+        return self._apply_operations(operations)
+
+    def _apply_operations(self, operations: List[PlanOperation]) -> bool:
+        """按顺序执行同一目录层级的计划操作，遇到失败立即停止"""
+        for operation, merged in PlanOperation.pair(operations):
+            if not self._apply_operation(operation, merged):
+                return False
+        return True
+
+    def _apply_operation(self, operation: PlanOperation, merged: PlanOperation = None) -> bool:
+        """执行一项计划操作，merged 为与 replace 合并提交的 copy 操作"""
+        action, src_dir, dst_dir, names = operation.action, operation.src_dir, operation.dst_dir, operation.names
+        if action == "mkdir":
+            return self.create_directory(dst_dir)
+
+        if action == "replace" and self.replace_strategy == "remove":
+            if not self._batch_operation("remove", names, dir=dst_dir):
+                logger.error(f"删除目标文件失败: {dst_dir} {names}")
+                return False
+            logger.info(f"删除目标目录【{dst_dir}】已变更文件 {len(names)} 个")
+        elif action == "replace" and self.replace_strategy == "rename":
+            if not self._rename_batch(dst_dir, names):
+                return False
+            logger.info(f"目标目录【{dst_dir}】已变更文件改名备份 {len(names)} 个")
+
+        if action in ("copy", "replace"):
+            copy_names = (merged.names if merged else []) + names
+            overwrite = {"overwrite": True} if action == "replace" and self.replace_strategy == "overwrite" else {}
+            if not self._batch_operation("copy", copy_names, src_dir=src_dir, dst_dir=dst_dir, **overwrite):
+                logger.error("文件复制失败")
+                if action == "replace" and self.replace_strategy == "rename" and self._rename_batch(dst_dir, names, False):
+                    logger.info(f"已恢复目标目录【{dst_dir}】的旧文件 {len(names)} 个")
+                return False
+            if action == "replace" and self.replace_strategy == "rename":
+                self._register_backups(operation)
+            logger.info(f"文件复制成功 - 从【{src_dir}】到【{dst_dir}】共 {len(copy_names)} 个")
+            self._count("copied", len(copy_names), operation.size + (merged.size if merged else 0))
+            return True
+
+        if action == "remove_source":
+            if not self._batch_operation("remove", names, dir=src_dir):
+                logger.error(f"删除源文件失败: {src_dir} {names}")
+                return False
+            logger.info(f"删除源目录【{src_dir}】文件成功 {len(names)} 个")
+            return True
+
+        if action == "remove_backup":
+            if not self._batch_operation("remove", names, dir=dst_dir):
+                logger.error(f"删除旧文件备份失败: {dst_dir} {names}")
+                return False
+            logger.info(f"替换已确认，删除目标目录【{dst_dir}】的旧文件备份 {len(names)} 个")
+            return True
+
+        if action == "remove_empty":
+            # 判定目录已清空所依据的列表可能是很久之前获取的，删除前由服务端自底向上清理空目录并重新确认，
+            # 同步期间新写入的文件所在目录会被保留
+            removable, removed = [], 0
+            for name in names:
+                path = f"{src_dir}/{name}"
+                if not self.remove_empty_directory(path):
+                    # 服务端不支持该接口或执行失败时，逐层列举确认为空后自底向上删除
+                    removed += self._remove_empty_tree(path)
+                elif self._list_directory(path) == []:
+                    removable.append(name)
+                else:
+                    logger.warning(f"源目录【{path}】不为空或无法确认，保留")
+            if removable and not self._batch_operation("remove", removable, dir=src_dir):
+                logger.error(f"删除空文件夹失败: {src_dir} {removable}")
+                return False
+            logger.info(f"删除源目录【{src_dir}】下的空文件夹成功 {len(removable) + removed} 个")
+            return True
+
+        if action == "trash":
+            if not self._ensure_trash_dir(operation.trash_dir):
+                return False
+            if not self._batch_operation("move", names, src_dir=dst_dir, dst_dir=operation.trash_dir):
+                logger.error(f"移动到回收站失败: {dst_dir} {names}")
+                return False
+            logger.info(f"移动到回收站【{operation.trash_dir}】成功 {len(names)} 个")
+            self._count("deleted", len(names))
+            return True
+
+        # delete
+        if not self._batch_operation("remove", names, dir=dst_dir):
+            logger.error(f"删除项目失败: {dst_dir} {names}")
+            return False
+        logger.info(f"删除目标目录【{dst_dir}】多余项目成功 {len(names)} 个")
+        self._count("deleted", len(names))
+        return True
+
+    def execute_plan(self, operations: Iterable[PlanOperation], concurrency: int = None) -> bool:
+        """
+        执行同步计划。目录创建按计划顺序依次执行（父目录在前），
+        其余操作按目录层级分组并发执行，组内保持计划顺序，最后删除已清空的源目录
+        """
+        self._start_sync()
+        directories: List[PlanOperation] = []
+        empty_directories: List[PlanOperation] = []
+        groups: Dict[Tuple[str, str], List[PlanOperation]] = {}
+        for operation in operations:
+            if operation.action == "mkdir":
+                directories.append(operation)
+            elif operation.action == "remove_empty":
+                empty_directories.append(operation)
+            else:
+                groups.setdefault((operation.src_dir, operation.dst_dir), []).append(operation)
+
+        logger.info(f"开始执行同步计划 - 创建目录: {len(directories)}, 目录层级: {len(groups)}")
+        for operation in directories:
+            if not self._apply_operation(operation):
+                return False
+        workers = max(1, int(concurrency or self.concurrency))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="alist-sync-plan") as executor:
+            result = all(list(executor.map(self._apply_operations, groups.values())))
+        if result:
+            for operation in empty_directories:
+                self._apply_operation(operation)
+        self._confirm_replacements()
+        logger.info(f"同步计划执行完成，结果: {'成功' if result else '失败'}")
+        return result
+
+    def plan_directories(self, src_dir: str, dst_dir: str, sink: Callable[[PlanOperation], None]) -> bool:
+        """只比较不修改，把两个目录的同步计划逐项交给 sink，sink 可能在多个线程中被调用"""
+        self._operation_sink = sink
+        try:
+            return self.sync_directories(src_dir, dst_dir)
+        finally:
+            self._operation_sink = None
+
+    def iter_plan(self, src_dir: str, dst_dir: str) -> Iterator[Dict]:
+        """
+        流式生成同步计划，逐条返回计划操作的字典，适合输出为 JSON Lines。
+        最后一条为 {"action": "done", ...}，success 表示计划是否完整。
+        生成器被关闭（读取方停止读取）时遍历随之停止
+        """
+        records = queue.Queue(maxsize=self.PLAN_QUEUE_SIZE)
+        cancelled = threading.Event()
+
+        def run():
+            try:
+                result = self.plan_directories(
+                    src_dir, dst_dir, lambda operation: put_until_cancelled(records, operation.to_dict(), cancelled))
+            except Exception as e:
+                if not cancelled.is_set():
+                    logger.error(f"生成同步计划失败: {str(e)}")
+                result = False
+            try:
+                put_until_cancelled(records, {"action": "done", "src_dir": src_dir, "dst_dir": dst_dir,
+                                              "success": result and not cancelled.is_set()}, cancelled)
+            except PlanCancelled:
+                logger.info(f"同步计划的读取方已停止读取，停止遍历: {src_dir}")
+
+        thread = threading.Thread(target=run, name="alist-sync-plan", daemon=True)
+        thread.start()
+        try:
+            while True:
+                record = records.get()
+                yield record
+                if record["action"] == "done":
+                    break
+        finally:
+            cancelled.set()
+        thread.join()
+
+    @staticmethod
+    def _is_not_found(response: Optional[Dict]) -> bool:
+        """服务端明确返回路径不存在；请求失败等无法确认的情况返回 False"""
+        return (bool(response) and response.get("code") != 200
+                and "not found" in str(response.get("message") or "").lower())
+
     def is_path_exists(self, path: str) -> bool:
         """检查路径是否存在"""
         response = self._directory_operation("get", path=path)
@@ -327,118 +2230,338 @@ class AlistSync:
         return []
 
     def check_regex(self, path: str) -> bool:
-        if self.regex_patterns_list:
-            for regex in self.regex_patterns_list:
-                if regex.match(path):
-                    return True
-        if self.regex_pattern and self.regex_pattern.match(path):
-            return True
-        return False
+        return self.file_filter.match_name(path)
 
-    def sync_directories(self, src_dir: str, dst_dir: str) -> bool:
-        """同步两个目录"""
-        try:
-
-            # 重试已失败任务
+    def _start_sync(self) -> None:
+        """每次同步开始时重置重试预算和缓存的任务、挂载点信息"""
+        self.retry_policy.reset()
+        # 重试已失败任务，生成计划时不修改任何内容
+        if self._operation_sink is None:
             self.get_copy_task_retry_failed()
-            # 获取正在运行任务
-            self.get_copy_task_undone()
+        # 获取正在运行任务
+        self.get_copy_task_undone()
+
+        self._mount_index = None
+        self._trash_dirs = set()
 
+    def _sync_target(self, src_dir: str, dst_dir: str) -> bool:
+        """把已确认存在的源目录同步到一个目标目录"""
+        try:
             logger.info(f"开始同步目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
-            if not self.is_path_exists(src_dir):
-                logger.error(f"源目录【{src_dir}】不存在，停止同步")
-                return False
             result = self._recursive_copy(src_dir, dst_dir)
-            # 递归删除空文件夹
-            if self.move_file_action:
-                self._remove_empty_folders(src_dir, src_dir)
-
             logger.info(f"目录同步完成 - 源目录: {src_dir}, 目标目录: {dst_dir}, 结果: {'成功' if result else '失败'}")
             return result
         except Exception as e:
-            logger.error(f"同步目录失败: {str(e)}")
+            logger.error(f"同步目录失败: {dst_dir}, 错误: {str(e)}")
             return False
 
-    def _recursive_copy(self, src_dir: str, dst_dir: str) -> bool:
-        """递归复制目录内容"""
+    @traced("sync", _trace_dirs)
+    def sync_directories(self, src_dir: str, dst_dir: str) -> bool:
+        """同步两个目录"""
         try:
-            if src_dir in self.exclude_list:
-                logger.info(f"排除目录: {src_dir}, 跳过同步")
-                return True
-            else:
-                logger.info(f"开始递归复制 - 源目录: {src_dir}, 目标目录: {dst_dir}")
-                src_contents = self.get_directory_contents(src_dir)
-                if not src_contents:
-                    logger.info(f"源目录为空或获取内容失败: {src_dir}")
-                    # return True
-
-                if self.sync_delete:
-                    self._handle_sync_delete(src_dir, dst_dir, src_contents)
-                if src_contents:
-                    for item in src_contents:
-                        if not self._copy_item_with_check(src_dir, dst_dir, item):
-                            logger.error(f"复制项目失败: {item.get('name', '未知项目')}")
-                            return False
-                    logger.info(f"递归复制完成 - 源目录: {src_dir}, 目标目录: {dst_dir}")
-                return True
+            self._start_sync()
+            if not self.is_path_exists(src_dir):
+                logger.error(f"源目录【{src_dir}】不存在，停止同步")
+                return False
+            result = self._sync_target(src_dir, dst_dir)
+            self._confirm_replacements()
+            return result
         except Exception as e:
-            logger.error(f"递归复制失败: {str(e)}")
-        return False
+            logger.error(f"同步目录失败: {str(e)}")
+            return False
 
-    def _handle_sync_delete(self, src_dir: str, dst_dir: str, src_contents: List[Dict]):
-        """处理同步删除逻辑"""
+    @traced("sync", _trace_dirs)
+    def sync_fan_out(self, src_dir: str, dst_dirs: List[str]) -> bool:
+        """
+        把一个源目录同步到多个目标目录：源目录每一层只列举一次，各目标并发比较和同步。
+        源目录的列举结果保留到所有目标都取用为止，内存占用随目标间的进度差增长。
+        返回是否全部目标同步成功
+        """
+        if len(dst_dirs) <= 1:
+            return all(self.sync_directories(src_dir, dst_dir) for dst_dir in dst_dirs)
         try:
-            dst_contents = self.get_directory_contents(dst_dir)
-            src_names = {}
-            if src_contents:
-                src_names = {item["name"] for item in src_contents}
+            self._start_sync()
+            if not self.is_path_exists(src_dir):
+                logger.error(f"源目录【{src_dir}】不存在，停止同步")
+                return False
+            self._source_cache = SourceListingCache(len(dst_dirs))
+            with ThreadPoolExecutor(max_workers=len(dst_dirs), thread_name_prefix="alist-sync-target") as executor:
+                results = list(executor.map(functools.partial(self._sync_target, src_dir), dst_dirs))
+            self._confirm_replacements()
+            return all(results)
+        except Exception as e:
+            logger.error(f"同步目录失败: {str(e)}")
+            return False
+        finally:
+            self._source_cache = None
+
+    def _state_options(self) -> str:
+        """影响同步结果的配置摘要，配置变更后旧的增量记录不再生效"""
+        options = json.dumps([
+            sorted(self.path_filter.exclude_rules),
+            self.regex_pattern.pattern if self.regex_pattern else None,
+            [regex.pattern for regex in self.regex_patterns_list],
+            self.sync_delete_action,
+            self.move_file_action,
+        ] + (["hash"] if self.compare_hash else []) + self.file_filter.fingerprint()
+            + ([sorted(self.path_filter.include_rules)] if self.path_filter.include_rules else []))
+        return hashlib.sha1(options.encode("utf-8")).hexdigest()
+
+    def _begin_walk(self, src_dir: str, dst_dir: str) -> DirectoryWalk:
+        """开始一次目录遍历，增量同步时加载上次的目录记录"""
+        # 相对规则从本次同步的源目录开始匹配
+        self.path_filter = self.path_filter.rooted(src_dir)
+        records = {}
+        full_scan = False
+        if self.incremental and self.file_filter.relative_time:
+            # 距今时长的时间条件范围随时间变化，未变化的目录中也可能有文件进入范围，增量记录不可复用，也不写入
+            full_scan = True
+            logger.info("修改时间条件使用距今时长，增量同步本次完整遍历")
+        elif self.incremental:
+            if self._state_index is None:
+                self._state_index = SyncStateIndex(self.state_db_path)
+            # 未变化的目录不比较文件，原地修改的文件要靠定期完整遍历发现
+            last_full_scan = self._state_index.last_full_scan(self._state_options(), src_dir)
+            if self.full_scan_hours and (last_full_scan is None
+                                         or time.time() - last_full_scan >= self.full_scan_hours * 3600):
+                full_scan = True
+                logger.info(f"增量同步已启用，距上次完整遍历超过 {self.full_scan_hours} 小时，本次完整遍历")
+            else:
+                records = self._state_index.load(self._state_options(), src_dir)
+                logger.info(f"增量同步已启用，加载目录记录 {len(records)} 条")
+        return DirectoryWalk(src_dir, dst_dir, records, full_scan)
+
+    def _finish_walk(self, walk: DirectoryWalk, result: bool):
+        """结束目录遍历，只有整次同步成功时才更新增量记录"""
+        if not result:
+            return
+        logger.info(f"递归复制完成 - 源目录: {walk.root.src_dir}, 目标目录: {walk.root.dst_dir}")
+        # 生成计划时并未实际同步，不更新增量记录
+        if self.incremental and self._operation_sink is None and not self.file_filter.relative_time:
+            try:
+                self._state_index.save(self._state_options(), walk.clean_nodes, walk.dirty_nodes)
+                if walk.full_scan:
+                    self._state_index.mark_full_scan(self._state_options(), walk.root.src_dir)
+                self._state_index.purge(self.STATE_MAX_AGE_DAYS * 86400)
+                logger.info(f"增量记录已更新 - 一致目录: {len(walk.clean_nodes)}, 未变化目录: {walk.skipped}")
+            except sqlite3.Error as e:
+                logger.error(f"更新增量记录失败: {str(e)}")
+
+    @traced("sync", _trace_dirs)
+    def _recursive_copy(self, src_dir: str, dst_dir: str) -> bool:
+        """递归复制目录内容，各目录由线程池并发处理"""
+        walk = self._begin_walk(src_dir, dst_dir)
+        result = True
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="alist-sync") as executor:
+            # future -> 目录节点
+            pending = {executor.submit(self._sync_directory, src_dir, dst_dir): walk.root}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    try:
+                        batch = future.result()
+                    except PlanCancelled:
+                        # 计划读取方已停止读取，不再继续遍历
+                        batch = None
+                    except Exception as e:
+                        logger.error(f"递归复制失败: {node.src_dir}, 错误: {str(e)}")
+                        batch = None
+
+                    if batch is None:
+                        result = False
+                    # 出现失败后不再派发新任务，与串行遍历遇错即停的行为保持一致
+                    if not result:
+                        continue
+
+                    for child in walk.expand(node, batch):
+                        child_future = executor.submit(self._sync_directory, child.src_dir, child.dst_dir,
+                                                       child.dst_entry is not None,
+                                                       walk.records if child.unchanged else None)
+                        pending[child_future] = child
+        # 移动模式下删除遍历中发现的空文件夹，同一父目录的合并为一次请求
+        if result and self.move_file_action:
+            for parent_src, parent_dst, names in walk.empty_directories:
+                self._submit_operations([PlanOperation("remove_empty", parent_src, parent_dst, names)])
+        self._finish_walk(walk, result)
+        return result
+
+    def _unchanged_batch(self, src_dir: str, dst_dir: str, items: List[Dict],
+                         records: Dict[Tuple[str, str], Tuple]) -> Optional[DirectoryBatch]:
+        """
+        增量同步中元数据未变化的目录：源目录列表与上次同步一致时，子目录沿用上次同步记录的目标元数据，不列举目标目录、不比较文件。
+        列表有变化、有子目录没有记录（上次未同步一致），或移动模式下仍有源文件时返回 None，由调用方完整比较
+        """
+        digest = SyncStateIndex.listing_digest(SyncStateIndex.listing_key(item) for item in items)
+        if digest != records[(src_dir, dst_dir)][4]:
+            return None
+        batch = DirectoryBatch(src_dir, dst_dir)
+        batch.unchanged = True
+        batch.src_digest = digest
+        for item in items:
+            batch.item_count += 1
+            if not item.get("is_dir"):
+                if self.move_file_action:
+                    return None
+                continue
+            src_path = f"{src_dir}/{item['name']}".replace('//', '/')
+            if not self.path_filter.visit(src_path):
+                continue
+            recorded = records.get((src_path, f"{dst_dir}/{item['name']}".replace('//', '/')))
+            if recorded is None:
+                return None
+            batch.sub_directories.append((item, {"name": item["name"], "is_dir": True,
+                                                 "size": recorded[2], "modified": recorded[3]}))
+        logger.info(f"目录【{src_dir}】自上次同步后未变化，只检查子目录")
+        return batch
+
+    @traced("sync", _trace_dirs)
+    def _sync_directory(self, src_dir: str, dst_dir: str, dst_exists: bool = True,
+                        records: Dict[Tuple[str, str], Tuple] = None) -> Optional[DirectoryBatch]:
+        """
+        同步单个目录层级：目标目录列举一次作为对照，源目录分页流式比较，操作按批次大小提交。
+        传入增量记录表示目录自身未变化，优先只检查子目录。
+        返回本层级的目录批次（含需要继续遍历的子目录），失败时返回 None
+        """
+        batch = DirectoryBatch(src_dir, dst_dir)
+        if not self.path_filter.visit(src_dir):
+            logger.info(f"排除目录: {src_dir}, 跳过同步")
+            batch.excluded = True
+            return batch
+
+        source = self._iter_source(src_dir)
+        if records is not None:
+            try:
+                items = list(source)
+            except AlistAPIError as e:
+                logger.error(str(e))
+                batch.listing_failed = True
+                return batch
+            unchanged = self._unchanged_batch(src_dir, dst_dir, items, records)
+            if unchanged is not None:
+                return unchanged
+            source = iter(items)
+
+        if not dst_exists:
+            logger.info(f"创建目标子目录: {dst_dir}")
+            if not self._submit_operations([PlanOperation("mkdir", src_dir, dst_dir)]):
+                return None
 
-            dst_names = {}
-            if dst_contents:
-                dst_names = {item["name"] for item in dst_contents}
+        logger.info(f"开始递归复制 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+        self._refresh_copy_tasks_if_stale()
+        # 新建的目标目录必然为空，无需列举
+        dst_contents = self._list_directory(dst_dir) if dst_exists else []
+        if dst_contents is None:
+            # 列举失败时不能当作空目录，否则会重新复制整个子树；只有确认目标目录不存在时才创建
+            if not self._is_not_found(self._directory_operation("get", path=dst_dir)):
+                logger.error(f"目标目录列举失败，跳过该目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+                return None
+            logger.info(f"目标目录不存在，创建目录: {dst_dir}")
+            if not self._submit_operations([PlanOperation("mkdir", src_dir, dst_dir)]):
+                return None
+            dst_contents = []
+        dst_entries = {item["name"]: item for item in dst_contents}
 
-            if src_names:
-                to_delete = set(dst_names) - set(src_names)
+        src_names: Set[str] = set()
+        # 增量同步时记录源目录列表摘要，下次同步据此判断本层是否变化
+        listing: Optional[List[str]] = [] if self.incremental else None
+        try:
+            for item in source:
+                src_names.add(item.get("name"))
+                if listing is not None:
+                    listing.append(SyncStateIndex.listing_key(item))
+                batch.item_count += 1
+                if not self._copy_item_with_check(src_dir, dst_dir, item, batch, dst_entries):
+                    logger.error(f"复制项目失败: {item.get('name', '未知项目')}")
+                    return None
+                if (len(batch.copy_names) + len(batch.replace_names) >= self.batch_size
+                        and not self._flush_batch(batch, include_source_removal=False)):
+                    return None
+        except AlistAPIError as e:
+            logger.error(str(e))
+            batch.listing_failed = True
+        if not src_names:
+            logger.info(f"源目录为空或获取内容失败: {src_dir}")
+        if listing is not None and not batch.listing_failed:
+            batch.src_digest = SyncStateIndex.listing_digest(listing)
+
+        if len(batch) and not self._flush_batch(batch):
+            return None
+        # 只是通向包含目录的上级目录时不处理差异项
+        if self.sync_delete and self.path_filter.covers(src_dir):
+            if batch.listing_failed:
+                # 列举不完整时无法判断差异项，避免误删目标文件
+                logger.warning(f"目录列举失败，跳过同步删除 - 源目录: {src_dir}, 目标目录: {dst_dir}")
             else:
-                to_delete = dst_names
+                batch.deleted = self._handle_sync_delete(src_dir, dst_dir, src_names, dst_contents)
+        return batch
+
+    @traced("sync", _trace_dirs)
+    def _handle_sync_delete(self, src_dir: str, dst_dir: str, src_names: Set[str],
+                            dst_contents: List[Dict] = None) -> bool:
+        """处理同步删除逻辑，同一目录的差异项合并为一次移动或删除请求，返回是否存在需要处理的差异项"""
+        try:
+            if dst_contents is None:
+                dst_contents = self.get_directory_contents(dst_dir)
+            to_delete = self._sync_delete_names(src_names, dst_contents)
 
             if not to_delete:
                 logger.info("没有需要删除的项目")
-                return
+                return False
 
-            for name in to_delete:
-                if self.sync_delete_action == "move":
-                    logger.info(f"处理同步移动 - 目录: {dst_dir}")
-                    logger.info(f"处理移动项目: {name}")
-                    trash_dir = self._get_trash_dir(dst_dir)
-                    if trash_dir:
-                        if not self.is_path_exists(trash_dir):
-                            logger.info(f"创建回收站目录: {trash_dir}")
-                            self.create_directory(trash_dir)
-                        logger.info(f"移动到回收站: {name}")
-                        self._move_item(dst_dir, trash_dir, name)
-                else:  # delete
-                    logger.info(f"处理同步删除 - 目录: {dst_dir}")
-                    logger.info(f"处理删除项目: {name}")
-                    logger.info(f"直接删除项目: {name}")
-                    self._directory_operation("remove", dir=dst_dir, names=[name])
+            if self.sync_delete_action == "move":
+                logger.info(f"处理同步移动 - 目录: {dst_dir}, 项目: {to_delete}")
+                trash_dir = self._get_trash_dir(dst_dir)
+                if trash_dir:
+                    self._submit_operations([PlanOperation("trash", src_dir, dst_dir, to_delete, trash_dir)])
+            else:  # delete
+                logger.info(f"处理同步删除 - 目录: {dst_dir}, 项目: {to_delete}")
+                self._submit_operations([PlanOperation("delete", src_dir, dst_dir, to_delete)])
+            return True
         except Exception as e:
             logger.error(f"处理同步删除失败: {str(e)}")
+            return True
+
+    def _sync_delete_names(self, src_names: Set[str], dst_contents: List[Dict]) -> List[str]:
+        """目标目录多余的项目，源文件仍存在的旧文件备份由替换确认流程删除"""
+        suffix = self.BACKUP_SUFFIX
+        return sorted(name for name in {item["name"] for item in dst_contents} - src_names
+                      if not (name.endswith(suffix) and name[:-len(suffix)] in src_names))
+
+    def _ensure_trash_dir(self, trash_dir: str) -> bool:
+        """确保回收站目录存在，每次同步中每个目录只检查和创建一次"""
+        with self._trash_lock:
+            if trash_dir in self._trash_dirs:
+                return True
+            if not self.is_path_exists(trash_dir):
+                logger.info(f"创建回收站目录: {trash_dir}")
+                if not self.create_directory(trash_dir):
+                    return False
+            self._trash_dirs.add(trash_dir)
+            return True
 
     def _get_trash_dir(self, dst_dir: str) -> Optional[str]:
-        """获取回收站目录路径"""
-        storage_list = self.get_storage_list()
-        for mount_path in storage_list:
-            if dst_dir.startswith(mount_path):
-                return f"{mount_path}/trash{dst_dir[len(mount_path):]}"
-        return None
+        """获取回收站目录路径，存储挂载列表在每次同步中只获取一次"""
+        with self._trash_lock:
+            if self._mount_index is None:
+                self._mount_index = MountIndex(self.get_storage_list())
+            mount_index = self._mount_index
+        mount_path = mount_index.resolve(dst_dir)
+        if mount_path is None:
+            logger.warning(f"未找到目录【{dst_dir}】所属的存储，跳过移动到回收站")
+            return None
+        return f"{mount_path}/trash{dst_dir[len(mount_path):]}".replace('//', '/')
 
     def close(self):
         """关闭连接"""
         try:
-            if hasattr(self, 'connection') and self.connection:
-                self.connection.close()
-                logger.debug("连接已关闭")
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=False)
+                self._prefetch_executor = None
+            self.connection_pool.close()
+            if self.tracer is not None:
+                self.tracer.save()
+            logger.debug("连接已关闭")
         except Exception as e:
             logger.error(f"关闭连接时发生错误: {str(e)}")
 
@@ -449,8 +2572,19 @@ class AlistSync:
             return response.get("data", {})
         return None
 
-    def _copy_item_with_check(self, src_dir: str, dst_dir: str, item: Dict) -> bool:
-        """复制项目并进行检查"""
+    @traced("sync", _trace_item)
+    def _copy_item_with_check(self, src_dir: str, dst_dir: str, item: Dict,
+                              batch: DirectoryBatch = None, dst_entries: Dict[str, Dict] = None) -> bool:
+        """
+        对照目标目录列表（名称 -> 项目）检查项目，需要复制或删除的文件登记到目录批次中。
+        未传入目标目录列表时现场列举，未传入批次时立即提交
+        """
+        if dst_entries is None:
+            dst_entries = {entry["name"]: entry for entry in self.get_directory_contents(dst_dir)}
+        if batch is None:
+            batch = DirectoryBatch(src_dir, dst_dir)
+            return (self._copy_item_with_check(src_dir, dst_dir, item, batch, dst_entries)
+                    and self._flush_batch(batch))
         try:
             item_name = item.get('name')
             if not item_name:
@@ -458,230 +2592,1103 @@ class AlistSync:
                 return False
 
             logger.info(f"处理项目: {item_name}")
-            if src_dir in self.exclude_list:
-                logger.info(f"排除目录: {src_dir}, 跳过同步")
-                return True
 
             # 处理文件
             src_path = f"{src_dir}/{item_name}".replace('//', '/')
             dst_path = f"{dst_dir}/{item_name}".replace('//', '/')
 
-            # 如果是目录，递归处理
-            if item.get('is_dir', False):
+            dst_info = dst_entries.get(item_name)
 
-                # 确保目标子目录存在
-                if not self.is_path_exists(dst_path):
-                    logger.info(f"创建目标子目录: {dst_path}")
-                    if not self.create_directory(dst_path):
-                        return False
-                else:
+            # 如果是目录，登记为待遍历子目录，目标子目录不存在时由遍历任务创建；被排除的目录整个子树都不列举
+            if item.get('is_dir', False):
+                if not self.path_filter.visit(src_path):
+                    logger.info(f"排除目录: {src_path}, 跳过同步")
+                    return True
+                if dst_info:
                     logger.info(f"文件夹【{dst_path}】已存在，跳过创建")
-
-                # 递归复制子目录
-                return self._recursive_copy(src_path, dst_path)
+                batch.sub_directories.append((item, dst_info))
+                return True
             else:
+                # 只是通向包含目录的上级目录，其中的文件不同步
+                if not self.path_filter.covers(src_dir):
+                    return True
+                self._count("scanned")
 
-                # 判断正则表达式,如果符合正则表达式跳过复制
-                if(self.regex_patterns_list or self.regex_pattern):
-                    if not self.check_regex(item_name):
-                        logger.info(f"不符合正则表达式: {src_path}, 跳过同步")
-                        return True
+                # 按名称、大小和修改时间过滤，不满足条件的文件跳过复制
+                reason = self.file_filter.reject_reason(item)
+                if reason:
+                    logger.info(f"{reason}: {src_path}, 跳过同步")
+                    self._count("skipped")
+                    return True
 
-                    # 检查是否在未完成的任务列表中，如果存在，则跳过
-                    for task_item in self.task_list:
-                        if src_dir in task_item and dst_dir in task_item and src_path in task_item:
-                            logger.info(f"文件【{item_name}】在未完成的任务列表中，跳过复制")
-                            return True
+                # 检查是否在未完成的任务列表中，如果存在，则跳过
+                if self.task_index.contains(src_dir, dst_dir, item_name):
+                    logger.info(f"文件【{item_name}】在未完成的任务列表中，跳过复制")
+                    self._count("skipped")
+                    return True
                 # 检查目标文件是否存在
-                if not self.is_path_exists(dst_path):
+                if not dst_info:
                     logger.info(f"复制文件: {item_name}")
-                    return self._copy_item(src_dir, dst_dir, item_name)
+                    batch.copy_names.append(item_name)
+                    batch.copy_bytes += item.get("size") or 0
+                    return True
                 else:
-                    # 获取源文件和目标文件信息
+                    # 比较源文件和目标文件信息
                     src_size = item.get("size")
-                    dst_info = self.get_file_info(dst_path)
+                    dst_size = dst_info.get("size")
 
-                    if not dst_info:
-                        logger.error(f"获取目标文件信息失败: {dst_path}")
-                        return False
+                    # 两侧提供相同算法的哈希时按内容判断，否则按大小和修改时间判断
+                    same_content = compare_hashes(item, dst_info) if self.compare_hash else None
+                    # 上次替换留下的旧文件备份：目标文件已是完整的复制结果，备份不再需要
+                    if self.backup_name(item_name) in dst_entries:
+                        batch.remove_backup_names.append(self.backup_name(item_name))
 
-                    dst_size = dst_info.get("size")
+                    if same_content is False:
+                        logger.info(f"文件【{item_name}】哈希不一致，删除并重新复制")
+                        batch.replace_names.append(item_name)
+                        batch.replace_bytes += src_size or 0
+                        return True
 
                     # 比较文件大小
-                    if src_size == dst_size:
-                        logger.info(f"文件【{item_name}】已存在且大小相同，跳过复制")
+                    if same_content or src_size == dst_size:
+                        logger.info(f"文件【{item_name}】已存在且{'哈希' if same_content else '大小'}相同，跳过复制")
+                        self._count("skipped")
                         if self.move_file_action:
-                            if not self._directory_operation("remove", dir=src_dir, names=[item_name]):
-                                logger.error(f"删除源文件失败: {src_path}")
-                                return False
-                            else:
-                                logger.info(f"删除源文件成功: {src_path}")
-                                return True
-                        else:
-                            return True
+                            logger.info(f"删除源文件: {src_path}")
+                            batch.remove_source_names.append(item_name)
+                        return True
                     else:
                         # 比较修改时间
                         src_modified = parse_time_and_adjust_utc(item.get("modified"))
                         dst_modified = parse_time_and_adjust_utc(dst_info.get("modified"))
 
-                        if src_modified and dst_modified and dst_modified > src_modified:
+                        if (src_modified and dst_modified
+                                and dst_modified > src_modified - self.mtime_tolerance):
                             logger.info(f"文件【{item_name}】目标文件修改时间晚于源文件，跳过复制")
+                            self._count("skipped")
                             if self.move_file_action:
-                                if not self._directory_operation("remove", dir=src_dir, names=[item_name]):
-                                    logger.error(f"删除源文件失败: {src_dir}")
-                                    return False
-                                else:
-                                    logger.error(f"删除源文件: {src_dir}")
-                                    return True
-                            else:
-                                return True
+                                logger.info(f"删除源文件: {src_path}")
+                                batch.remove_source_names.append(item_name)
+                            return True
                         else:
                             logger.info(f"文件【{item_name}】存在变更，删除并重新复制")
-                            # 删除旧文件
-                            if not self._directory_operation("remove", dir=dst_dir, names=[item_name]):
-                                logger.error(f"删除目标文件失败: {dst_path}")
-                                return False
-                            # 复制新文件
-                            return self._copy_item(src_dir, dst_dir, item_name)
+                            batch.replace_names.append(item_name)
+                            batch.replace_bytes += src_size or 0
+                            return True
         except Exception as e:
             logger.error(f"复制项目时发生错误: {str(e)}")
             return False
 
 
-def get_dir_pairs_from_env() -> List[str]:
+class AsyncAlistSync(AlistSync):
+    """
+    基于 asyncio 的同步引擎，与 AlistSync 的同步语义一致（排除目录、正则、移动、同步删除）。
+    目录遍历在单个事件循环中进行，请求数由连接池信号量限制，不再占用线程
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 以下对象绑定事件循环，每次同步时创建
+        self._async_pool: Optional[AsyncConnectionPool] = None
+        self._async_trash_lock: Optional[asyncio.Lock] = None
+        self._async_copy_window_lock: Optional[asyncio.Lock] = None
+        self._async_request_gate: Optional[asyncio.Condition] = None
+        self._task_refreshing = False
+
+    def sync_directories(self, src_dir: str, dst_dir: str) -> bool:
+        """同步两个目录"""
+        return asyncio.run(self.sync_directories_async(src_dir, dst_dir))
+
+    def sync_fan_out(self, src_dir: str, dst_dirs: List[str]) -> bool:
+        """把一个源目录同步到多个目标目录，规则同 AlistSync.sync_fan_out"""
+        return asyncio.run(self.sync_fan_out_async(src_dir, dst_dirs))
+
+    def _request_headers(self) -> Dict:
+        return {
+            "Authorization": self.token,
+            "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
+            "Content-Type": "application/json"
+        }
+
+    async def _make_request_async(self, method: str, path: str, headers: Dict = None,
+                                  payload: str = None) -> Optional[Dict]:
+        """发送HTTP请求并返回JSON响应，临时错误按重试策略退避重试"""
+        attempt = 0
+        while True:
+            status, result, error = await self._send_request_async(method, path, headers, payload)
+            reason, safe = self.retry_policy.classify(status, result, error)
+            if reason and self.retry_policy.allow(path, attempt, safe):
+                delay = self.retry_policy.backoff(attempt)
+                attempt += 1
+                logger.warning(f"请求{reason}，{delay:.1f} 秒后第 {attempt} 次重试 - 方法: {method}, 路径: {path}")
+                await asyncio.sleep(delay)
+                continue
+            if error is not None:
+                logger.error(f"请求失败 - 方法: {method}, 路径: {path}, 状态码: {status}, "
+                             f"错误: {str(error) or type(error).__name__}")
+                return None
+            return result
+
+    @traced("http", _trace_request, _trace_request_name)
+    async def _send_request_async(self, method: str, path: str, headers: Dict = None,
+                                  payload: str = None) -> Tuple[Optional[int], Optional[Dict], Optional[Exception]]:
+        """发送一次请求，返回 (状态码, JSON响应, 异常)"""
+        controller = self._concurrency_controller
+        if controller:
+            async with self._async_request_gate:
+                await self._async_request_gate.wait_for(controller.try_acquire)
+        start = time.monotonic()
+        status, result = None, None
+        try:
+            logger.debug(f"发送请求 - 方法: {method}, 路径: {path}")
+            status, body = await self._async_pool.request(method, path, body=payload, headers=headers)
+            result = json.loads(body.decode("utf-8"))
+            logger.debug(f"请求响应: {result}")
+            return status, result, None
+        except Exception as e:
+            return status, None, e
+        finally:
+            latency, outcome = time.monotonic() - start, AdaptiveConcurrency.classify(status, result)
+            metrics.observe_request(path.split("?", 1)[0], outcome, latency)
+            if controller:
+                controller.release(latency, outcome)
+                async with self._async_request_gate:
+                    self._async_request_gate.notify_all()
+
+    async def _directory_operation_async(self, operation: str, **kwargs) -> Optional[Dict]:
+        """执行目录操作"""
+        if not self.token:
+            if not await asyncio.to_thread(self.login):
+                return None
+        return await self._make_request_async("POST", f"/api/fs/{operation}", self._request_headers(),
+                                              json.dumps(kwargs))
+
+    async def _task_operation_async(self, method: str, operation: str, **kwargs) -> Optional[Dict]:
+        """执行任务操作"""
+        if not self.token:
+            if not await asyncio.to_thread(self.login):
+                return None
+        return await self._make_request_async(method, f"/api/admin/task/{operation}", self._request_headers(),
+                                              json.dumps(kwargs))
+
+    async def get_copy_task_undone_async(self):
+        """获取未完成的复制任务并重建索引"""
+        response = await self._task_operation_async("GET", "copy/undone")
+        self._update_task_index(response)
+        return True
+
+    async def _refresh_copy_tasks_if_stale_async(self):
+        """索引过期时刷新，同一时刻只有一个协程刷新，其余协程继续使用旧索引"""
+        if self._task_refreshing or time.monotonic() - self._task_index_time < self.task_refresh_interval:
+            return
+        self._task_refreshing = True
+        try:
+            await self.get_copy_task_undone_async()
+        finally:
+            self._task_refreshing = False
+
+    async def _wait_for_copy_capacity_async(self, count: int):
+        """未完成的复制任务达到上限时，按指数退避轮询任务队列，规则同 _wait_for_copy_capacity"""
+        if not self.max_copy_tasks:
+            return
+        async with self._async_copy_window_lock:
+            delay = self.copy_poll_interval
+            while self._copy_window_full(count):
+                await self.get_copy_task_undone_async()
+                if not self._copy_window_full(count):
+                    break
+                logger.info(f"未完成的复制任务 {self._copy_tasks_in_flight} 个，达到上限 {self.max_copy_tasks}，"
+                            f"{delay} 秒后重新检查")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.copy_poll_max_interval)
+            self._copy_tasks_in_flight += count
+
+    async def get_copy_task_retry_failed_async(self) -> List[Dict]:
+        """重试失败的复制任务"""
+        response = await self._task_operation_async("POST", "copy/retry_failed")
+        return response.get("data", []) if response else []
+
+    async def _list_page_async(self, directory_path: str, page: int, per_page: int) -> Tuple[List[Dict], int]:
+        """获取目录的一页内容，返回 (项目列表, 项目总数)"""
+        response = await self._directory_operation_async("list", path=directory_path, page=page,
+                                                         per_page=per_page)
+        if not response or response.get("code") != 200:
+            message = response.get("message") if response else "请求失败"
+            raise AlistAPIError(f"获取目录内容失败: {directory_path}, 第 {page} 页, 错误: {message}")
+        data = response.get("data") or {}
+        return data.get("content") or [], data.get("total") or 0
+
+    async def iter_directory_contents_async(self, directory_path: str, per_page: int = None,
+                                            prefetch: bool = True) -> AsyncIterator[Dict]:
+        """
+        分页流式获取目录内容，调用方处理当前页时并发预取下一页。
+        请求失败时抛出 AlistAPIError
+        """
+        per_page = per_page or self.page_size
+        page, fetched = 1, 0
+        next_page = None
+        try:
+            content, total = await self._list_page_async(directory_path, page, per_page)
+            while True:
+                fetched += len(content)
+                has_more = bool(content) and fetched < total
+                next_page = None
+                if has_more and prefetch:
+                    next_page = asyncio.ensure_future(self._list_page_async(directory_path, page + 1, per_page))
+                for item in content:
+                    yield item
+                if not has_more:
+                    return
+                page += 1
+                content, total = await (next_page or self._list_page_async(directory_path, page, per_page))
+        finally:
+            # 调用方提前结束遍历时取消未使用的预取请求
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    @staticmethod
+    async def _iter_items_async(items: List[Dict]) -> AsyncIterator[Dict]:
+        for item in items:
+            yield item
+
+    async def _collect_directory_async(self, directory_path: str) -> List[Dict]:
+        """一次取得目录的全部内容，请求失败时抛出 AlistAPIError"""
+        async with aclosing(self.iter_directory_contents_async(directory_path)) as items:
+            return [item async for item in items]
+
+    async def _iter_source_async(self, src_dir: str) -> AsyncIterator[Dict]:
+        """遍历源目录内容，多目标同步时各目标共用同一次列举"""
+        if self._source_cache is None:
+            async with aclosing(self.iter_directory_contents_async(src_dir)) as items:
+                async for item in items:
+                    yield item
+            return
+        for item in await self._source_cache.get_async(src_dir, lambda: self._collect_directory_async(src_dir)):
+            yield item
+
+    async def _list_directory_async(self, directory_path: str) -> Optional[List[Dict]]:
+        """获取目录内容，请求失败时返回 None 以便与空目录区分"""
+        try:
+            return [item async for item in self.iter_directory_contents_async(directory_path)]
+        except AlistAPIError as e:
+            logger.error(str(e))
+            return None
+
+    async def create_directory_async(self, directory_path: str) -> bool:
+        """创建目录"""
+        response = await self._directory_operation_async("mkdir", path=directory_path)
+        if response and response.get("code") == 200:
+            logger.info(f"文件夹【{directory_path}】创建成功")
+            return True
+        logger.error("文件夹创建失败")
+        return False
+
+    async def remove_empty_directory_async(self, directory_path: str) -> bool:
+        """删除空文件夹"""
+        response = await self._directory_operation_async("remove_empty_directory", src_dir=directory_path)
+        if response and response.get("code") == 200:
+            logger.info(f"删除空文件夹【{directory_path}】成功")
+            return True
+        logger.warning(f"删除空文件夹失败: {directory_path} {response.get('message') if response else ''}")
+        return False
+
+    async def _remove_empty_tree_async(self, path: str) -> bool:
+        """自底向上删除 path 及其下的空目录，规则同 _remove_empty_tree"""
+        entries = await self._list_directory_async(path)
+        if entries is None:
+            return False
+        sub_directories = [item["name"] for item in entries if item.get("is_dir")]
+        for name in sub_directories:
+            await self._remove_empty_tree_async(f"{path}/{name}")
+        if sub_directories:
+            entries = await self._list_directory_async(path)
+        if entries != []:
+            logger.warning(f"源目录【{path}】不为空或无法确认，保留")
+            return False
+        parent, _, name = path.rpartition("/")
+        return await self._batch_operation_async("remove", [name], dir=parent or "/")
+
+    async def is_path_exists_async(self, path: str) -> bool:
+        """检查路径是否存在"""
+        response = await self._directory_operation_async("get", path=path)
+        return bool(response and response.get("message") == "success")
+
+    async def get_storage_list_async(self) -> List[str]:
+        """获取存储列表"""
+        if not self.token:
+            if not await asyncio.to_thread(self.login):
+                return []
+        response = await self._make_request_async("GET", "/api/admin/storage/list", self._request_headers())
+        if response:
+            storage_list = response["data"]["content"]
+            return [item["mount_path"] for item in storage_list]
+        logger.error("获取存储列表失败")
+        return []
+
+    async def _batch_operation_async(self, operation: str, names: List[str], **kwargs) -> bool:
+        """按批次大小拆分 names 执行 copy/move/remove 等操作"""
+        for i in range(0, len(names), self.batch_size):
+            chunk = names[i:i + self.batch_size]
+            if operation == "copy":
+                await self._wait_for_copy_capacity_async(len(chunk))
+            if not await self._submit_chunk_async(operation, chunk, **kwargs):
+                return False
+        return True
+
+    async def _submit_chunk_async(self, operation: str, names: List[str], **kwargs) -> bool:
+        """提交一批 copy/move/remove，失败时的重新确认规则同 _submit_chunk"""
+        attempt = 0
+        while True:
+            response = await self._directory_operation_async(operation, names=names, **kwargs)
+            if response and response.get("code") == 200:
+                return True
+            message = response.get("message") if response else "请求失败"
+            reason, transient = self.retry_policy.classify_response(response)
+            # 覆盖复制不重新确认目录，只有临时错误值得重发
+            if (reason is None or (not transient and kwargs.get("overwrite"))
+                    or not self.retry_policy.allow(f"/api/fs/{operation}", attempt, True)):
+                logger.error(f"批量操作 {operation} 失败: {kwargs} {names}, 错误: {message}")
+                return False
+            if transient:
+                await asyncio.sleep(self.retry_policy.backoff(attempt))
+            attempt += 1
+            if not kwargs.get("overwrite"):
+                if operation == "copy":
+                    await self.get_copy_task_undone_async()
+                entries = await self._list_directory_async(self._recheck_directory(operation, **kwargs))
+                names = self._unconfirmed_names(operation, names, entries, **kwargs)
+                if names is None:
+                    return False
+                if not names:
+                    logger.info(f"批量操作 {operation} 请求失败（{message}），重新确认后均已完成: {kwargs}")
+                    return True
+            logger.warning(f"批量操作 {operation} 请求失败（{message}），第 {attempt} 次重新提交 {len(names)} 项: {kwargs}")
+
+    async def _rename_batch_async(self, dst_dir: str, names: List[str], backup: bool = True) -> bool:
+        """按批次大小批量改名，规则同 _rename_batch"""
+        for i in range(0, len(names), self.batch_size):
+            objects, attempt = self._rename_objects(names[i:i + self.batch_size], backup), 0
+            while objects:
+                response = await self._directory_operation_async("batch_rename", src_dir=dst_dir,
+                                                                 rename_objects=objects)
+                if response and response.get("code") == 200:
+                    break
+                message = response.get("message") if response else "请求失败"
+                reason, transient = self.retry_policy.classify_response(response)
+                if reason is None or not self.retry_policy.allow("/api/fs/batch_rename", attempt, True):
+                    logger.error(f"批量改名失败: {dst_dir} {message}")
+                    return False
+                if transient:
+                    await asyncio.sleep(self.retry_policy.backoff(attempt))
+                attempt += 1
+                objects = self._pending_renames(objects, await self._list_directory_async(dst_dir))
+                if objects is None:
+                    return False
+                logger.warning(f"批量改名失败（{message}），第 {attempt} 次重新提交 {len(objects)} 项: {dst_dir}")
+        return True
+
+    async def _confirm_replacements_async(self):
+        """同步结束时确认替换结果，规则同 _confirm_replacements"""
+        with self._backup_lock:
+            pending, self._pending_backups = self._pending_backups, {}
+        if not pending:
+            return
+        await self.get_copy_task_undone_async()
+        kept = 0
+        for (src_dir, dst_dir), names in pending.items():
+            entries = {entry["name"]: entry for entry in await self._list_directory_async(dst_dir) or []}
+            confirmed = self._confirmed_backups(src_dir, dst_dir, names, entries)
+            kept += len(names) - len(confirmed)
+            if confirmed:
+                await self._submit_operations_async([PlanOperation("remove_backup", src_dir, dst_dir, confirmed)])
+        if kept:
+            logger.info(f"{kept} 个文件的复制任务尚未完成，旧文件备份保留到下次同步确认后删除")
+
+    async def _flush_batch_async(self, batch: DirectoryBatch, include_source_removal: bool = True) -> bool:
+        """批量提交一个目录内登记的操作，规则同 _flush_batch"""
+        if not await self._submit_operations_async(self._batch_plan(batch, include_source_removal)):
+            return False
+        batch.clear(include_source_removal)
+        return True
+
+    async def _submit_operations_async(self, operations: List[PlanOperation]) -> bool:
+        """生成同步计划时交给计划输出，否则立即按顺序执行"""
+        if self._operation_sink is not None:
+            # 计划输出可能因读取方跟不上而阻塞，整批放到线程中执行，避免阻塞事件循环
+            sink = self._operation_sink
+            await asyncio.to_thread(lambda: [sink(operation) for operation in operations])
+            return True
+        for operation, merged in PlanOperation.pair(operations):
+            if not await self._apply_operation_async(operation, merged):
+                return False
+        return True
+
+    async def _apply_operation_async(self, operation: PlanOperation, merged: PlanOperation = None) -> bool:
+        """执行一项计划操作，规则同 _apply_operation"""
+        action, src_dir, dst_dir, names = operation.action, operation.src_dir, operation.dst_dir, operation.names
+        if action == "mkdir":
+            return await self.create_directory_async(dst_dir)
+
+        if action == "replace" and self.replace_strategy == "remove":
+            if not await self._batch_operation_async("remove", names, dir=dst_dir):
+                logger.error(f"删除目标文件失败: {dst_dir} {names}")
+                return False
+            logger.info(f"删除目标目录【{dst_dir}】已变更文件 {len(names)} 个")
+        elif action == "replace" and self.replace_strategy == "rename":
+            if not await self._rename_batch_async(dst_dir, names):
+                return False
+            logger.info(f"目标目录【{dst_dir}】已变更文件改名备份 {len(names)} 个")
+
+        if action in ("copy", "replace"):
+            copy_names = (merged.names if merged else []) + names
+            overwrite = {"overwrite": True} if action == "replace" and self.replace_strategy == "overwrite" else {}
+            if not await self._batch_operation_async("copy", copy_names, src_dir=src_dir, dst_dir=dst_dir,
+                                                     **overwrite):
+                logger.error("文件复制失败")
+                if (action == "replace" and self.replace_strategy == "rename"
+                        and await self._rename_batch_async(dst_dir, names, False)):
+                    logger.info(f"已恢复目标目录【{dst_dir}】的旧文件 {len(names)} 个")
+                return False
+            if action == "replace" and self.replace_strategy == "rename":
+                self._register_backups(operation)
+            logger.info(f"文件复制成功 - 从【{src_dir}】到【{dst_dir}】共 {len(copy_names)} 个")
+            self._count("copied", len(copy_names), operation.size + (merged.size if merged else 0))
+            return True
+
+        if action == "remove_source":
+            if not await self._batch_operation_async("remove", names, dir=src_dir):
+                logger.error(f"删除源文件失败: {src_dir} {names}")
+                return False
+            logger.info(f"删除源目录【{src_dir}】文件成功 {len(names)} 个")
+            return True
+
+        if action == "remove_backup":
+            if not await self._batch_operation_async("remove", names, dir=dst_dir):
+                logger.error(f"删除旧文件备份失败: {dst_dir} {names}")
+                return False
+            logger.info(f"替换已确认，删除目标目录【{dst_dir}】的旧文件备份 {len(names)} 个")
+            return True
+
+        if action == "remove_empty":
+            # 判定目录已清空所依据的列表可能是很久之前获取的，删除前由服务端自底向上清理空目录并重新确认，
+            # 同步期间新写入的文件所在目录会被保留
+            removable, removed = [], 0
+            for name in names:
+                path = f"{src_dir}/{name}"
+                if not await self.remove_empty_directory_async(path):
+                    # 服务端不支持该接口或执行失败时，逐层列举确认为空后自底向上删除
+                    removed += await self._remove_empty_tree_async(path)
+                elif await self._list_directory_async(path) == []:
+                    removable.append(name)
+                else:
+                    logger.warning(f"源目录【{path}】不为空或无法确认，保留")
+            if removable and not await self._batch_operation_async("remove", removable, dir=src_dir):
+                logger.error(f"删除空文件夹失败: {src_dir} {removable}")
+                return False
+            logger.info(f"删除源目录【{src_dir}】下的空文件夹成功 {len(removable) + removed} 个")
+            return True
+
+        if action == "trash":
+            if not await self._ensure_trash_dir_async(operation.trash_dir):
+                return False
+            if not await self._batch_operation_async("move", names, src_dir=dst_dir, dst_dir=operation.trash_dir):
+                logger.error(f"移动到回收站失败: {dst_dir} {names}")
+                return False
+            logger.info(f"移动到回收站【{operation.trash_dir}】成功 {len(names)} 个")
+            self._count("deleted", len(names))
+            return True
+
+        # delete
+        if not await self._batch_operation_async("remove", names, dir=dst_dir):
+            logger.error(f"删除项目失败: {dst_dir} {names}")
+            return False
+        logger.info(f"删除目标目录【{dst_dir}】多余项目成功 {len(names)} 个")
+        self._count("deleted", len(names))
+        return True
+
+    def _open_async_session(self):
+        """创建绑定当前事件循环的连接池和锁"""
+        self._async_pool = AsyncConnectionPool(self.base_url, max_size=self.concurrency,
+                                               timeout=self.request_timeout)
+        self._async_trash_lock = asyncio.Lock()
+        self._async_copy_window_lock = asyncio.Lock()
+        self._async_request_gate = asyncio.Condition()
+
+    async def _start_sync_async(self) -> None:
+        """每次同步开始时重置重试预算和缓存的任务、挂载点信息"""
+        self.retry_policy.reset()
+        # 重试已失败任务，生成计划时不修改任何内容
+        if self._operation_sink is None:
+            await self.get_copy_task_retry_failed_async()
+        # 获取正在运行任务
+        await self.get_copy_task_undone_async()
+
+        self._mount_index = None
+        self._trash_dirs = set()
+
+    async def _sync_target_async(self, src_dir: str, dst_dir: str) -> bool:
+        """把已确认存在的源目录同步到一个目标目录"""
+        try:
+            logger.info(f"开始同步目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+            result = await self._recursive_copy_async(src_dir, dst_dir)
+            logger.info(f"目录同步完成 - 源目录: {src_dir}, 目标目录: {dst_dir}, 结果: {'成功' if result else '失败'}")
+            return result
+        except Exception as e:
+            logger.error(f"同步目录失败: {dst_dir}, 错误: {str(e)}")
+            return False
+
+    @traced("sync", _trace_dirs)
+    async def sync_directories_async(self, src_dir: str, dst_dir: str) -> bool:
+        """同步两个目录"""
+        self._open_async_session()
+        try:
+            await self._start_sync_async()
+            if not await self.is_path_exists_async(src_dir):
+                logger.error(f"源目录【{src_dir}】不存在，停止同步")
+                return False
+            result = await self._sync_target_async(src_dir, dst_dir)
+            await self._confirm_replacements_async()
+            return result
+        except Exception as e:
+            logger.error(f"同步目录失败: {str(e)}")
+            return False
+        finally:
+            await self._async_pool.close()
+
+    @traced("sync", _trace_dirs)
+    async def sync_fan_out_async(self, src_dir: str, dst_dirs: List[str]) -> bool:
+        """把一个源目录同步到多个目标目录，各目标的请求共用同一个连接池和并发上限"""
+        if len(dst_dirs) <= 1:
+            results = [await self.sync_directories_async(src_dir, dst_dir) for dst_dir in dst_dirs]
+            return all(results)
+        self._open_async_session()
+        try:
+            await self._start_sync_async()
+            if not await self.is_path_exists_async(src_dir):
+                logger.error(f"源目录【{src_dir}】不存在，停止同步")
+                return False
+            self._source_cache = SourceListingCache(len(dst_dirs))
+            results = await asyncio.gather(*(self._sync_target_async(src_dir, dst_dir) for dst_dir in dst_dirs))
+            await self._confirm_replacements_async()
+            return all(results)
+        except Exception as e:
+            logger.error(f"同步目录失败: {str(e)}")
+            return False
+        finally:
+            self._source_cache = None
+            await self._async_pool.close()
+
+    @traced("sync", _trace_dirs)
+    async def _recursive_copy_async(self, src_dir: str, dst_dir: str) -> bool:
+        """递归复制目录内容，同时处理的目录数不超过并发数"""
+        walk = self._begin_walk(src_dir, dst_dir)
+        result = True
+        ready = deque([walk.root])
+        # task -> 目录节点
+        pending: Dict[asyncio.Future, DirectoryNode] = {}
+        while pending or (ready and result):
+            # 出现失败后不再派发新目录，与线程池引擎的行为保持一致
+            while ready and result and len(pending) < self.concurrency:
+                node = ready.popleft()
+                dst_exists = node.parent is None or node.dst_entry is not None
+                records = walk.records if node.unchanged else None
+                task = asyncio.ensure_future(self._sync_directory_async(node.src_dir, node.dst_dir, dst_exists,
+                                                                        records))
+                pending[task] = node
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node = pending.pop(task)
+                try:
+                    batch = task.result()
+                except PlanCancelled:
+                    # 计划读取方已停止读取，不再继续遍历
+                    batch = None
+                except Exception as e:
+                    logger.error(f"递归复制失败: {node.src_dir}, 错误: {str(e)}")
+                    batch = None
+
+                if batch is None:
+                    result = False
+                if not result:
+                    continue
+                ready.extend(walk.expand(node, batch))
+        # 移动模式下删除遍历中发现的空文件夹，同一父目录的合并为一次请求
+        if result and self.move_file_action:
+            for parent_src, parent_dst, names in walk.empty_directories:
+                await self._submit_operations_async([PlanOperation("remove_empty", parent_src, parent_dst, names)])
+        self._finish_walk(walk, result)
+        return result
+
+    @traced("sync", _trace_dirs)
+    async def _sync_directory_async(self, src_dir: str, dst_dir: str, dst_exists: bool = True,
+                                    records: Dict[Tuple[str, str], Tuple] = None) -> Optional[DirectoryBatch]:
+        """同步单个目录层级，规则同 _sync_directory，失败时返回 None"""
+        batch = DirectoryBatch(src_dir, dst_dir)
+        if not self.path_filter.visit(src_dir):
+            logger.info(f"排除目录: {src_dir}, 跳过同步")
+            batch.excluded = True
+            return batch
+
+        source = self._iter_source_async(src_dir)
+        if records is not None:
+            try:
+                async with aclosing(source) as items:
+                    listed = [item async for item in items]
+            except AlistAPIError as e:
+                logger.error(str(e))
+                batch.listing_failed = True
+                return batch
+            unchanged = self._unchanged_batch(src_dir, dst_dir, listed, records)
+            if unchanged is not None:
+                return unchanged
+            source = self._iter_items_async(listed)
+
+        if not dst_exists:
+            logger.info(f"创建目标子目录: {dst_dir}")
+            if not await self._submit_operations_async([PlanOperation("mkdir", src_dir, dst_dir)]):
+                return None
+
+        logger.info(f"开始递归复制 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+        await self._refresh_copy_tasks_if_stale_async()
+        # 新建的目标目录必然为空，无需列举
+        dst_contents = await self._list_directory_async(dst_dir) if dst_exists else []
+        if dst_contents is None:
+            # 列举失败时不能当作空目录，只有确认目标目录不存在时才创建
+            if not self._is_not_found(await self._directory_operation_async("get", path=dst_dir)):
+                logger.error(f"目标目录列举失败，跳过该目录 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+                return None
+            logger.info(f"目标目录不存在，创建目录: {dst_dir}")
+            if not await self._submit_operations_async([PlanOperation("mkdir", src_dir, dst_dir)]):
+                return None
+            dst_contents = []
+        dst_entries = {item["name"]: item for item in dst_contents}
+
+        src_names: Set[str] = set()
+        listing: Optional[List[str]] = [] if self.incremental else None
+        try:
+            async with aclosing(source) as items:
+                async for item in items:
+                    src_names.add(item.get("name"))
+                    if listing is not None:
+                        listing.append(SyncStateIndex.listing_key(item))
+                    batch.item_count += 1
+                    if not self._copy_item_with_check(src_dir, dst_dir, item, batch, dst_entries):
+                        logger.error(f"复制项目失败: {item.get('name', '未知项目')}")
+                        return None
+                    if (len(batch.copy_names) + len(batch.replace_names) >= self.batch_size
+                            and not await self._flush_batch_async(batch, include_source_removal=False)):
+                        return None
+        except AlistAPIError as e:
+            logger.error(str(e))
+            batch.listing_failed = True
+        if not src_names:
+            logger.info(f"源目录为空或获取内容失败: {src_dir}")
+        if listing is not None and not batch.listing_failed:
+            batch.src_digest = SyncStateIndex.listing_digest(listing)
+
+        if len(batch) and not await self._flush_batch_async(batch):
+            return None
+        # 只是通向包含目录的上级目录时不处理差异项
+        if self.sync_delete and self.path_filter.covers(src_dir):
+            if batch.listing_failed:
+                # 列举不完整时无法判断差异项，避免误删目标文件
+                logger.warning(f"目录列举失败，跳过同步删除 - 源目录: {src_dir}, 目标目录: {dst_dir}")
+            else:
+                batch.deleted = await self._handle_sync_delete_async(src_dir, dst_dir, src_names, dst_contents)
+        return batch
+
+    @traced("sync", _trace_dirs)
+    async def _handle_sync_delete_async(self, src_dir: str, dst_dir: str, src_names: Set[str],
+                                        dst_contents: List[Dict]) -> bool:
+        """处理同步删除逻辑，规则同 _handle_sync_delete"""
+        try:
+            to_delete = self._sync_delete_names(src_names, dst_contents)
+
+            if not to_delete:
+                logger.info("没有需要删除的项目")
+                return False
+
+            if self.sync_delete_action == "move":
+                logger.info(f"处理同步移动 - 目录: {dst_dir}, 项目: {to_delete}")
+                trash_dir = await self._get_trash_dir_async(dst_dir)
+                if trash_dir:
+                    await self._submit_operations_async([PlanOperation("trash", src_dir, dst_dir, to_delete,
+                                                                       trash_dir)])
+            else:  # delete
+                logger.info(f"处理同步删除 - 目录: {dst_dir}, 项目: {to_delete}")
+                await self._submit_operations_async([PlanOperation("delete", src_dir, dst_dir, to_delete)])
+            return True
+        except Exception as e:
+            logger.error(f"处理同步删除失败: {str(e)}")
+            return True
+
+    async def _ensure_trash_dir_async(self, trash_dir: str) -> bool:
+        """确保回收站目录存在，每次同步中每个目录只检查和创建一次"""
+        async with self._async_trash_lock:
+            if trash_dir in self._trash_dirs:
+                return True
+            if not await self.is_path_exists_async(trash_dir):
+                logger.info(f"创建回收站目录: {trash_dir}")
+                if not await self.create_directory_async(trash_dir):
+                    return False
+            self._trash_dirs.add(trash_dir)
+            return True
+
+    async def _get_trash_dir_async(self, dst_dir: str) -> Optional[str]:
+        """获取回收站目录路径，存储挂载列表在每次同步中只获取一次"""
+        async with self._async_trash_lock:
+            if self._mount_index is None:
+                self._mount_index = MountIndex(await self.get_storage_list_async())
+        mount_path = self._mount_index.resolve(dst_dir)
+        if mount_path is None:
+            logger.warning(f"未找到目录【{dst_dir}】所属的存储，跳过移动到回收站")
+            return None
+        return f"{mount_path}/trash{dst_dir[len(mount_path):]}".replace('//', '/')
+
+
+def get_dir_pairs_from_env(environ: Dict[str, str] = None) -> List[str]:
     """从环境变量获取目录对列表"""
+    environ = os.environ if environ is None else environ
     dir_pairs_list = []
 
     # 获取主DIR_PAIRS
-    if dir_pairs := os.environ.get("DIR_PAIRS"):
+    if dir_pairs := environ.get("DIR_PAIRS"):
         dir_pairs_list.extend(dir_pairs.split(";"))
 
     # 获取DIR_PAIRS1到DIR_PAIRS50
     for i in range(1, 51):
-        if dir_pairs := os.environ.get(f"DIR_PAIRS{i}"):
+        if dir_pairs := environ.get(f"DIR_PAIRS{i}"):
             dir_pairs_list.extend(dir_pairs.split(";"))
 
     return dir_pairs_list
 
 
-def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str = None, move_file: bool = False,
-         regex_patterns: str = None, ):
-    """主函数，用于命令行执行"""
-    code_souce()
-    xiaojin()
-
-    logger.info("开始执行同步任务")
-    # 从环境变量获取配置 0
-    base_url = os.environ.get("BASE_URL")
-    username = os.environ.get("USERNAME")
-    password = os.environ.get("PASSWORD")
-    token = os.environ.get("TOKEN")  # 添加token环境变量
-
-    # 是否删除目标目录多余文件
-    if sync_del_action:
-        sync_delete_action = sync_del_action
-    else:
-        sync_delete_action = os.environ.get("SYNC_DELETE_ACTION", "none")
-
-    # 是否删除源目录
-    if move_file:
-        move_file_action = move_file
-    else:
-        move_file_action = os.environ.get("MOVE_FILE", "false").lower() == "true"
+def parse_dir_pairs(pairs: Iterable[str]) -> List[Tuple[str, str]]:
+    """把 "源目录:目标目录" 形式的目录对解析为 (源目录, 目标目录)，格式错误的目录对记录错误后跳过"""
+    result = []
+    for pair in pairs:
+        if not pair.strip():
+            continue
+        parts = [part.strip() for part in pair.split(":")]
+        if len(parts) != 2 or not all(parts):
+            logger.error(f"目录对格式错误，应为 源目录:目标目录，跳过: {pair}")
+            continue
+        result.append((parts[0], parts[1]))
+    return result
+
+
+def _env_number(environ: Dict[str, str], key: str, label: str, default: Union[int, float],
+                cast: Callable = int) -> Union[int, float]:
+    """读取数值型环境变量，配置错误时记录警告并使用默认值"""
+    value = environ.get(key)
+    try:
+        return cast(value or default)
+    except ValueError:
+        logger.warning(f"{label}({key})配置错误: {value}，使用默认值 {default}")
+        return default
 
-    # 删除源目录和删除多余目标目录无法同时生效
-    if move_file_action:
-        sync_delete_action = "none"
 
-    # 排除目录
-    if exclude_dirs:
-        exclude_list = exclude_dirs.split(",")
-    else:
-        exclude_dirs = os.environ.get("EXCLUDE_DIRS", "")
-        exclude_list = exclude_dirs.split(",")
-
-    # 正则表达式
-    if not regex_patterns:
-        regex_patterns = os.environ.get("REGEX_PATTERNS", None)
-        # regex_patterns_list = regex_patterns.split(" ")
-    # else:
-    #     regex_patterns = os.environ.get("REGEX_PATTERNS", None)
-    #     regex_patterns_list = regex_patterns.split(" ")
-
-    # 初始化一个空列表，用于存储编译后的正则表达式对象
-    regex_and_replace_list: List[Pattern[str]] = []
-    # if regex_patterns_list:
-    #     for pattern_replacement in regex_patterns_list:
-    #         try:
-    #             compiled_pattern = re.compile(pattern_replacement)
-    #             regex_and_replace_list.append(compiled_pattern)
-    #         except re.error as e:
-    #             print(f"正则表达式 {pattern_replacement} 编译失败：{e}")
-    regex_pattern = None
-    try:
-        if regex_patterns:
-            regex_pattern = re.compile(regex_patterns)
-        # regex_and_replace_list.append(compiled_pattern)
-    except re.error as e:
-        print(f"正则表达式 {regex_patterns} 编译失败：{e}")
+@dataclass
+class SyncConfig:
+    """
+    一次同步任务的完整配置。run_sync 只读取该对象，不读取环境变量，
+    多个任务可以在同一进程中并发执行而互不影响；青龙脚本通过 from_env 从环境变量创建
+    """
+    base_url: str
+    username: Optional[str] = None
+    password: Optional[str] = None
+    token: Optional[str] = None
+    # (源目录, 目标目录)
+    dir_pairs: List[Tuple[str, str]] = field(default_factory=list)
+    # 目标目录多余文件的处理：none/move/delete，移动模式下不生效
+    sync_delete_action: str = "none"
+    move_file: bool = False
+    exclude_dirs: List[str] = field(default_factory=list)
+    include_dirs: List[str] = field(default_factory=list)
+    # 文件名正则，匹配任意一个即同步
+    regex_patterns: List[str] = field(default_factory=list)
+    file_filter: FileFilter = field(default_factory=FileFilter)
+    concurrency: int = 4
+    adaptive_concurrency: bool = False
+    request_timeout: float = 30
+    max_retries: int = 3
+    retry_budget: int = 100
+    batch_size: int = 100
+    page_size: int = 1000
+    max_copy_tasks: int = 0
+    incremental: bool = False
+    full_scan_hours: float = 24
+    replace_strategy: str = "remove"
+    compare_hash: bool = False
+    mtime_tolerance: float = 0
+    # 同步引擎：thread 为线程池，async 为 asyncio
+    engine: str = "thread"
+    # 源目录相同的目录对一次遍历同步到全部目标
+    fan_out: bool = False
+    dry_run: bool = False
+    # 执行 dry_run 生成的同步计划文件，设置后不比较目录对
+    plan_file: Optional[str] = None
+    # 指标中的任务名称
+    task_name: str = "default"
+    trace_dir: Optional[str] = None
+
+    def __post_init__(self):
+        self.sync_delete_action = (self.sync_delete_action or "none").lower()
+        # 删除源目录和删除多余目标目录无法同时生效
+        if self.move_file:
+            self.sync_delete_action = "none"
+
+    @classmethod
+    def from_env(cls, environ: Dict[str, str] = None) -> "SyncConfig":
+        """从环境变量创建，数值配置错误时记录警告并使用默认值"""
+        environ = os.environ if environ is None else environ
+
+        # 正则表达式，多个表达式每行一个
+        regex_patterns = environ.get("REGEX_PATTERNS") or ""
+        lines = [line for line in regex_patterns.splitlines() if line.strip()]
+        regex_patterns = lines if len(lines) > 1 else [regex_patterns] if regex_patterns else []
+
+        # 文件大小、修改时间和扩展名过滤
+        try:
+            file_filter = FileFilter.from_env(environ)
+        except ValueError as e:
+            logger.warning(f"文件过滤条件(FILTER_*)配置错误: {str(e)}，不按大小、时间和扩展名过滤")
+            file_filter = FileFilter()
+
+        # 已变更文件的替换策略
+        replace_strategy = environ.get("REPLACE_STRATEGY", "remove").lower()
+        if replace_strategy not in AlistSync.REPLACE_STRATEGIES:
+            logger.warning(f"替换策略(REPLACE_STRATEGY)配置错误: {replace_strategy}，使用默认值 remove")
+            replace_strategy = "remove"
+
+        sync_engine = environ.get("SYNC_ENGINE", "thread").lower()
+        if sync_engine not in ("thread", "async"):
+            logger.warning(f"同步引擎(SYNC_ENGINE)配置错误: {sync_engine}，使用默认值 thread")
+            sync_engine = "thread"
+
+        # 追踪各阶段和请求的耗时，追踪文件保存在 data/trace 目录
+        trace_dir = None
+        if environ.get("TRACE_SYNC", "false").lower() == "true":
+            trace_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/trace')
+
+        return cls(
+            base_url=environ.get("BASE_URL"),
+            username=environ.get("USERNAME"),
+            password=environ.get("PASSWORD"),
+            token=environ.get("TOKEN"),
+            dir_pairs=parse_dir_pairs(get_dir_pairs_from_env(environ)),
+            sync_delete_action=environ.get("SYNC_DELETE_ACTION", "none"),
+            move_file=environ.get("MOVE_FILE", "false").lower() == "true",
+            exclude_dirs=environ.get("EXCLUDE_DIRS", "").split(","),
+            include_dirs=environ.get("INCLUDE_DIRS", "").split(","),
+            regex_patterns=regex_patterns,
+            file_filter=file_filter,
+            concurrency=_env_number(environ, "SYNC_CONCURRENCY", "并发数", 4),
+            adaptive_concurrency=environ.get("ADAPTIVE_CONCURRENCY", "false").lower() == "true",
+            request_timeout=_env_number(environ, "REQUEST_TIMEOUT", "请求超时时间", 30, float),
+            max_retries=_env_number(environ, "REQUEST_RETRIES", "重试次数", 3),
+            retry_budget=_env_number(environ, "RETRY_BUDGET", "重试预算", 100),
+            batch_size=_env_number(environ, "BATCH_SIZE", "批量大小", 100),
+            page_size=_env_number(environ, "LIST_PAGE_SIZE", "分页大小", 1000),
+            max_copy_tasks=_env_number(environ, "MAX_COPY_TASKS", "复制任务上限", 0),
+            incremental=environ.get("INCREMENTAL_SYNC", "false").lower() == "true",
+            full_scan_hours=_env_number(environ, "INCREMENTAL_FULL_SCAN_HOURS", "完整遍历间隔", 24, float),
+            replace_strategy=replace_strategy,
+            compare_hash=environ.get("HASH_COMPARE", "false").lower() == "true",
+            mtime_tolerance=_env_number(environ, "MTIME_TOLERANCE", "修改时间误差", 0, float),
+            engine=sync_engine,
+            fan_out=environ.get("SYNC_FAN_OUT", "false").lower() == "true",
+            dry_run=environ.get("DRY_RUN", "false").lower() == "true",
+            plan_file=environ.get("APPLY_PLAN") or None,
+            task_name=environ.get("SYNC_TASK_NAME") or "default",
+            trace_dir=trace_dir,
+        )
+
+    def create_engine(self, progress: Callable[[str, int, int], None] = None) -> AlistSync:
+        """按配置创建同步引擎实例，文件名正则编译失败时记录错误并忽略全部正则"""
+        regex_patterns_list: List[Pattern[str]] = []
+        regex_pattern = None
+        try:
+            if len(self.regex_patterns) > 1:
+                regex_patterns_list = [re.compile(pattern) for pattern in self.regex_patterns]
+            elif self.regex_patterns:
+                regex_pattern = re.compile(self.regex_patterns[0])
+        except re.error as e:
+            logger.error(f"正则表达式 {self.regex_patterns} 编译失败：{e}")
+
+        sync_class = AsyncAlistSync if self.engine == "async" else AlistSync
+        return sync_class(self.base_url, self.username, self.password, self.token, self.sync_delete_action,
+                          self.exclude_dirs, self.move_file, regex_patterns_list, regex_pattern,
+                          concurrency=self.concurrency, request_timeout=self.request_timeout,
+                          batch_size=self.batch_size, incremental=self.incremental, page_size=self.page_size,
+                          max_copy_tasks=self.max_copy_tasks, adaptive_concurrency=self.adaptive_concurrency,
+                          max_retries=self.max_retries, retry_budget=self.retry_budget, task_name=self.task_name,
+                          trace_dir=self.trace_dir, mtime_tolerance=self.mtime_tolerance,
+                          compare_hash=self.compare_hash, replace_strategy=self.replace_strategy,
+                          include_list=self.include_dirs, file_filter=self.file_filter, progress=progress,
+                          full_scan_hours=self.full_scan_hours)
+
+
+def parse_plan(lines: Iterable[str]) -> List[PlanOperation]:
+    """
+    解析 JSON Lines 格式的同步计划，跳过空行和每个目录对末尾的 done 记录。
+    计划不完整（done 记录的 success 为 false）或包含未知操作时抛出 ValueError
+    """
+    operations = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {number} 行不是有效的 JSON: {str(e)}")
+        if record.get("action") == "done":
+            if not record.get("success"):
+                raise ValueError(f"同步计划不完整: {record.get('src_dir')} -> {record.get('dst_dir')}")
+            continue
+        operations.append(PlanOperation.from_dict(record))
+    return operations
+
+
+def run_sync(config: SyncConfig, plan_writer: Callable[[Dict], None] = None,
+             progress: Callable[[str, int, int], None] = None) -> bool:
+    """
+    按配置执行一次同步，返回全部目录对是否同步成功。只读取 config，可在多个线程中同时执行不同的任务。
+    dry_run 时只生成同步计划，每条计划记录交给 plan_writer，默认以 JSON Lines 输出到标准输出；
+    plan_writer 抛出 PlanCancelled 表示读取方已停止读取，遍历随之停止并向调用方抛出该异常。
+    progress 接收同步过程中的文件计数 (动作, 文件数, 字节数)
+    """
+    # 只生成同步计划，不修改任何文件
+    dry_run = config.dry_run or plan_writer is not None
+    if dry_run and plan_writer is None:
+        def plan_writer(record: Dict):
+            print(json.dumps(record, ensure_ascii=False), flush=True)
 
-    if not base_url:
+    if not config.base_url:
         logger.error("服务地址(BASE_URL)环境变量未设置")
-        return
+        return False
 
     # 修改验证逻辑
-    if not token and not (username and password):
+    if not config.token and not (config.username and config.password):
         logger.error("需要设置令牌(TOKEN)或者同时设置用户名(USERNAME)和密码(PASSWORD)")
-        return
+        return False
 
     logger.info(
-        f"配置信息 - URL: {base_url}, 用户名: {username}, 删除动作: {sync_delete_action}, 删除源目录: {move_file_action}")
+        f"配置信息 - URL: {config.base_url}, 用户名: {config.username}, 删除动作: {config.sync_delete_action}, "
+        f"删除源目录: {config.move_file}, 并发数: {config.concurrency}, 同步引擎: {config.engine}, 仅生成计划: {dry_run}")
+
+    operations = None
+    if config.plan_file and not dry_run:
+        try:
+            with open(config.plan_file, encoding="utf-8") as f:
+                operations = parse_plan(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"读取同步计划失败: {config.plan_file}, 错误: {str(e)}")
+            return False
 
-    # 创建AlistSync实例时添加token参数
-    alist_sync = AlistSync(base_url, username, password, token, sync_delete_action, exclude_list, move_file_action,
-                           regex_and_replace_list, regex_pattern)
+    alist_sync = config.create_engine(progress)
     # 验证 token 是否正确
     if not alist_sync.login():
         logger.error("令牌或用户名密码不正确")
         return False
+    task_name = config.task_name
+    start = time.monotonic()
     try:
-        # 获取同步目录对
-        dir_pairs_list = []
-        if dir_pairs:
-            dir_pairs_list.extend(dir_pairs.split(";"))
-        else:
-            dir_pairs_list = get_dir_pairs_from_env()
+        if operations is not None:
+            logger.info(f"执行同步计划【{config.plan_file}】，共 {len(operations)} 项操作")
+            success = alist_sync.execute_plan(operations)
+            metrics.set_last_run(task_name, time.monotonic() - start, bool(success))
+            return success
 
         logger.info(f"")
         logger.info(f"")
         num = 1
-        for pair in dir_pairs_list:
-            logger.info(f"No.{num:02d}【{pair}】")
+        for src_dir, dst_dir in config.dir_pairs:
+            logger.info(f"No.{num:02d}【{src_dir}:{dst_dir}】")
             num += 1
 
+        # 多个目录对的源目录相同时一次遍历同步到全部目标；移动模式会删除源文件，生成计划时无需实际同步，均逐个执行
+        fan_out = config.fan_out and not dry_run and not config.move_file
+        groups: List[Tuple[str, List[str]]] = []
+        grouped: Dict[str, List[str]] = {}
+        for src_dir, dst_dir in config.dir_pairs:
+            if fan_out and src_dir in grouped:
+                grouped[src_dir].append(dst_dir)
+                continue
+            grouped[src_dir] = [dst_dir]
+            groups.append((src_dir, grouped[src_dir]))
+
         # 执行同步
         i = 1
-        for pair in dir_pairs_list:
-            src_dir, dst_dir = pair.split(":")
+        success = True
+        for src_dir, dst_dirs in groups:
             logger.info(f"")
             logger.info(f"")
             logger.info(f"")
             logger.info(f"")
             logger.info(f"")
-            logger.info(f"第 [{i:02d}] 个 同步目录【{src_dir.strip()}】---->【 {dst_dir.strip()}】")
+            logger.info(f"第 [{i:02d}] 个 同步目录【{src_dir}】---->【 {', '.join(dst_dirs)}】")
             logger.info(f"")
             logger.info(f"")
             i += 1
-            alist_sync.sync_directories(src_dir.strip(), dst_dir.strip())
+            if dry_run:
+                with closing(alist_sync.iter_plan(src_dir, dst_dirs[0])) as records:
+                    for record in records:
+                        plan_writer(record)
+            elif len(dst_dirs) > 1:
+                success = alist_sync.sync_fan_out(src_dir, dst_dirs) and success
+            else:
+                success = alist_sync.sync_directories(src_dir, dst_dirs[0]) and success
 
+        if not dry_run:
+            metrics.set_last_run(task_name, time.monotonic() - start, bool(success))
         logger.info("所有同步任务执行完成")
+        return success
+    except PlanCancelled:
+        logger.info("同步计划的读取方已停止读取，停止生成计划")
+        raise
     except Exception as e:
         logger.error(f"执行同步任务时发生错误: {str(e)}")
+        if not dry_run:
+            metrics.set_last_run(task_name, time.monotonic() - start, False)
+        return False
     finally:
         alist_sync.close()
         logger.info("关闭连接，任务结束")
 
 
+def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str = None, move_file: bool = False,
+         regex_patterns: str = None, concurrency: int = None, dry_run: bool = False,
+         plan_writer: Callable[[Dict], None] = None, progress: Callable[[str, int, int], None] = None) -> bool:
+    """
+    主函数，用于命令行执行：从环境变量读取配置，传入的参数优先，返回全部目录对是否同步成功。
+    dry_run 时只生成同步计划，每条计划记录交给 plan_writer，默认以 JSON Lines 输出到标准输出；
+    progress 接收同步过程中的文件计数 (动作, 文件数, 字节数)
+    """
+    code_souce()
+    xiaojin()
+
+    logger.info("开始执行同步任务")
+    # 从环境变量获取配置
+    config = SyncConfig.from_env()
+    if dir_pairs:
+        config.dir_pairs = parse_dir_pairs(dir_pairs.split(";"))
+    if sync_del_action:
+        config.sync_delete_action = sync_del_action.lower()
+    if exclude_dirs:
+        config.exclude_dirs = exclude_dirs.split(",")
+    if move_file:
+        config.move_file = True
+        config.sync_delete_action = "none"
+    if regex_patterns:
+        lines = [line for line in regex_patterns.splitlines() if line.strip()]
+        config.regex_patterns = lines if len(lines) > 1 else [regex_patterns]
+    if concurrency:
+        config.concurrency = concurrency
+    config.dry_run = config.dry_run or dry_run
+    return run_sync(config, plan_writer, progress)
+
+
 def code_souce():
     logger.info("如果好用，请Star！非常感谢！ https://gitee.com/xjxjin/alist-sync")
     logger.info("如果好用，请Star！非常感谢！ https://github.com/xjxjin/alist-sync")
@@ -0,0 +1,350 @@
+"""
+本地模拟 Alist 服务，用于在没有真实 Alist 和网盘的情况下测量同步引擎。
+
+实现 alist_sync 用到的接口：fs/list、fs/get、fs/copy、fs/move、fs/remove、fs/remove_empty_directory、fs/mkdir、
+fs/batch_rename、admin/task/copy/*、admin/storage/list、auth/login、admin/setting/list。
+目录树保存在内存中，支持配置请求延迟、错误注入和复制任务的排队时间。
+
+单独运行：
+    python benchmark/mock_alist_server.py --port 5244 --entries 100000 --latency 0.02
+"""
+import argparse
+import copy
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Tuple
+
+TOKEN = "mock-token"
+MODIFIED = "2024-01-01T00:00:00Z"
+
+
+class MockTree:
+    """内存中的目录树，所有方法都需要在持有 lock 时调用"""
+
+    def __init__(self, mount_paths: Tuple[str, ...] = ("/src", "/dst")):
+        self.lock = threading.RLock()
+        self.root = self._new_dir("")
+        self.mount_paths = list(mount_paths)
+        for mount_path in self.mount_paths:
+            self.mkdir(mount_path)
+
+    @staticmethod
+    def _new_dir(name: str) -> Dict:
+        return {"name": name, "is_dir": True, "size": 0, "modified": MODIFIED, "children": {}}
+
+    def node(self, path: str) -> Optional[Dict]:
+        node = self.root
+        for part in [p for p in path.split("/") if p]:
+            if not node["is_dir"] or part not in node["children"]:
+                return None
+            node = node["children"][part]
+        return node
+
+    def mkdir(self, path: str) -> Dict:
+        node = self.root
+        for part in [p for p in path.split("/") if p]:
+            child = node["children"].get(part)
+            if child is None:
+                child = node["children"][part] = self._new_dir(part)
+            node = child
+        return node
+
+    def add_file(self, path: str, size: int, modified: str = MODIFIED):
+        parent, _, name = path.rpartition("/")
+        self.mkdir(parent)["children"][name] = {"name": name, "is_dir": False, "size": size, "modified": modified}
+
+    def count(self, path: str = "/") -> Tuple[int, int]:
+        """统计目录下的 (文件数, 目录数)"""
+        files, dirs = 0, 0
+        stack = [self.node(path)]
+        while stack:
+            node = stack.pop()
+            for child in node["children"].values():
+                if child["is_dir"]:
+                    dirs += 1
+                    stack.append(child)
+                else:
+                    files += 1
+        return files, dirs
+
+    def snapshot(self, path: str) -> Dict[str, object]:
+        """返回目录下 相对路径 -> 文件大小（目录为 "d"），用于比较同步结果"""
+        result = {}
+        stack = [("", self.node(path))]
+        while stack:
+            prefix, node = stack.pop()
+            for name, child in node["children"].items():
+                relative = f"{prefix}/{name}"
+                result[relative] = "d" if child["is_dir"] else child["size"]
+                if child["is_dir"]:
+                    stack.append((relative, child))
+        return result
+
+
+def build_tree(tree: MockTree, base: str, entries: int, files_per_dir: int = 50, dirs_per_dir: int = 5,
+               size_seed: int = 0):
+    """在 base 下按广度优先生成约 entries 个项目（文件和目录）"""
+    rng = random.Random(size_seed)
+    queue = [tree.mkdir(base)]
+    created = 0
+    index = 0
+    while created < entries and index < len(queue):
+        node = queue[index]
+        index += 1
+        for i in range(files_per_dir):
+            if created >= entries:
+                break
+            name = f"file_{i:04d}.bin"
+            node["children"][name] = {"name": name, "is_dir": False, "size": rng.randint(1, 1 << 30),
+                                      "modified": MODIFIED}
+            created += 1
+        for i in range(dirs_per_dir):
+            if created >= entries:
+                break
+            child = MockTree._new_dir(f"dir_{i:03d}")
+            node["children"][child["name"]] = child
+            queue.append(child)
+            created += 1
+    return created
+
+
+class MockAlist:
+    """模拟服务的状态：目录树、请求计数、延迟、错误注入和复制任务队列"""
+
+    def __init__(self, tree: MockTree = None, latency: float = 0.0, error_rate: float = 0.0,
+                 error_mode: str = "http", task_duration: float = 0.0, seed: int = 0):
+        self.tree = tree or MockTree()
+        self.latency = latency
+        self.error_rate = error_rate
+        # http: 返回 HTTP 500; throttle: 返回 Alist 限流消息
+        self.error_mode = error_mode
+        # 复制任务在未完成队列中停留的秒数，0 表示立即完成
+        self.task_duration = task_duration
+        self.counts = Counter()
+        self.errors = Counter()
+        self._tasks: List[Tuple[float, str]] = []
+        self._task_id = 0
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def reset_counts(self):
+        self.counts.clear()
+        self.errors.clear()
+
+    def _inject_error(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.error_rate
+
+    def _mount_of(self, path: str) -> str:
+        matches = [m for m in self.tree.mount_paths if path == m or path.startswith(m.rstrip("/") + "/")]
+        return max(matches, key=len) if matches else "/"
+
+    def _task_name(self, src_dir: str, dst_dir: str, name: str) -> str:
+        src_mount, dst_mount = self._mount_of(src_dir), self._mount_of(dst_dir)
+        src_path = f"{src_dir[len(src_mount):]}/{name}".replace("//", "/")
+        dst_path = dst_dir[len(dst_mount):] or "/"
+        return f"copy [{src_mount}]({src_path}) to [{dst_mount}]({dst_path})"
+
+    def undone_tasks(self) -> List[Dict]:
+        now = time.monotonic()
+        self._tasks = [(done_at, name) for done_at, name in self._tasks if done_at > now]
+        return [{"id": str(i), "name": name, "state": 1, "status": "", "progress": 0, "error": ""}
+                for i, (_, name) in enumerate(self._tasks)]
+
+    @classmethod
+    def _prune_empty(cls, node: Dict):
+        """与 Alist 一致自底向上删除 node 下的空子目录，node 本身保留"""
+        for name, child in list(node["children"].items()):
+            if child["is_dir"]:
+                cls._prune_empty(child)
+                if not child["children"]:
+                    del node["children"][name]
+
+    def handle(self, path: str, body: Dict, authorization: Optional[str]) -> Tuple[int, Dict]:
+        """处理一次请求，返回 (HTTP状态码, 响应JSON)"""
+        self.counts[path] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._inject_error():
+            self.errors[path] += 1
+            if self.error_mode == "throttle":
+                return 200, {"code": 429, "message": "too many requests", "data": None}
+            return 500, {"code": 500, "message": "internal error", "data": None}
+
+        ok = lambda data=None: (200, {"code": 200, "message": "success", "data": data})
+        fail = lambda message, code=500: (200, {"code": code, "message": message, "data": None})
+
+        if path == "/api/auth/login":
+            return ok({"token": TOKEN})
+        if authorization != TOKEN:
+            return fail("token is invalidated", 401)
+
+        tree = self.tree
+        with tree.lock:
+            if path == "/api/admin/setting/list":
+                return ok([{"key": "token", "value": TOKEN}])
+            if path == "/api/admin/storage/list":
+                return ok({"content": [{"mount_path": m} for m in tree.mount_paths], "total": len(tree.mount_paths)})
+            if path == "/api/admin/task/copy/undone":
+                return ok(self.undone_tasks())
+            if path.startswith("/api/admin/task/copy/"):
+                return ok([] if path.endswith("done") else None)
+
+            if path == "/api/fs/list":
+                node = tree.node(body.get("path") or "/")
+                if node is None or not node["is_dir"]:
+                    return fail("object not found")
+                children = list(node["children"].values())
+                total = len(children)
+                page, per_page = body.get("page") or 1, body.get("per_page") or 0
+                if per_page > 0:
+                    children = children[(page - 1) * per_page: page * per_page]
+                content = [{key: value for key, value in child.items() if key != "children"} for child in children]
+                return ok({"content": content, "total": total, "readme": "", "write": True, "provider": "mock"})
+            if path == "/api/fs/get":
+                node = tree.node(body.get("path") or "/")
+                if node is None:
+                    return fail("object not found")
+                return ok({key: value for key, value in node.items() if key != "children"})
+            if path == "/api/fs/mkdir":
+                tree.mkdir(body["path"])
+                return ok()
+            if path in ("/api/fs/copy", "/api/fs/move"):
+                src, dst = tree.node(body["src_dir"]), tree.node(body["dst_dir"])
+                if src is None or dst is None:
+                    return fail("object not found")
+                names = body.get("names") or []
+                missing = [name for name in names if name not in src["children"]]
+                if missing:
+                    return fail(f"object not found: {missing[0]}")
+                # 与 Alist 一致：目标已有同名项目且未指定 overwrite 时整批失败
+                existing = [name for name in names if name in dst["children"]]
+                if existing and not body.get("overwrite"):
+                    return fail(f"file [{existing[0]}] exists")
+                for name in names:
+                    dst["children"][name] = copy.deepcopy(src["children"][name])
+                    if path.endswith("move"):
+                        del src["children"][name]
+                    elif self.task_duration:
+                        self._tasks.append((time.monotonic() + self.task_duration,
+                                            self._task_name(body["src_dir"], body["dst_dir"], name)))
+                return ok()
+            if path == "/api/fs/batch_rename":
+                node = tree.node(body.get("src_dir") or "/")
+                if node is None or not node["is_dir"]:
+                    return fail("object not found")
+                for rename in body.get("rename_objects") or []:
+                    src_name, new_name = rename.get("src_name"), rename.get("new_name")
+                    if src_name not in node["children"] or new_name in node["children"]:
+                        return fail(f"rename failed: {src_name}")
+                    child = node["children"].pop(src_name)
+                    child["name"] = new_name
+                    node["children"][new_name] = child
+                return ok()
+            if path == "/api/fs/remove":
+                node = tree.node(body["dir"])
+                if node is None:
+                    return fail("object not found")
+                for name in body.get("names") or []:
+                    node["children"].pop(name, None)
+                return ok()
+            if path == "/api/fs/remove_empty_directory":
+                node = tree.node(body.get("src_dir") or "/")
+                if node is None or not node["is_dir"]:
+                    return fail("object not found")
+                self._prune_empty(node)
+                return ok()
+        return 404, {"code": 404, "message": f"not found: {path}", "data": None}
+
+
+def make_handler(alist: MockAlist):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 与 Alist 一致关闭 Nagle 算法，避免小响应被延迟确认拖慢
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                body = {}
+            status, result = alist.handle(self.path.split("?")[0], body, self.headers.get("Authorization"))
+            data = json.dumps(result).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _handle
+        do_POST = _handle
+
+    return Handler
+
+
+class MockAlistServer:
+    """在后台线程中运行模拟服务"""
+
+    def __init__(self, alist: MockAlist, host: str = "127.0.0.1", port: int = 0):
+        self.alist = alist
+        self._server = ThreadingHTTPServer((host, port), make_handler(alist))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAlistServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockAlistServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Alist 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5244)
+    parser.add_argument("--entries", type=int, default=1000, help="在 /src/data 下生成的项目数")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率")
+    parser.add_argument("--error-mode", choices=("http", "throttle"), default="http")
+    parser.add_argument("--task-duration", type=float, default=0.0, help="复制任务在未完成队列中停留的秒数")
+    args = parser.parse_args()
+
+    tree = MockTree()
+    build_tree(tree, "/src/data", args.entries)
+    alist = MockAlist(tree, args.latency, args.error_rate, args.error_mode, args.task_duration)
+    server = MockAlistServer(alist, args.host, args.port)
+    print(f"模拟 Alist 服务已启动: {server.url}  令牌: {TOKEN}  同步目录对: /src/data:/dst/data")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+同步引擎端到端基准测试：启动本地模拟 Alist 服务，生成指定规模的目录树并执行同步，
+输出耗时、总请求数、每个文件的请求数和各接口的请求数，用于发现性能回退。
+
+示例：
+    python benchmark/run_benchmark.py --sizes 1k,100k --engine thread,async
+    python benchmark/run_benchmark.py --sizes 1m --scenarios resync --latency 0.005 --json result.json
+    python benchmark/run_benchmark.py --sizes 10k --scenarios move,incremental --engine thread,async
+    python benchmark/run_benchmark.py --sizes 1m --scenarios resync --latency 0.005 --baseline result.json
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import alist_sync  # noqa: E402
+from mock_alist_server import MockAlist, MockAlistServer, MockTree, TOKEN, build_tree  # noqa: E402
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SRC_DIR = "/src/data"
+DST_DIR = "/dst/data"
+
+
+def touch_files(tree: MockTree, base: str):
+    """修改 base 下约 1% 的文件，并新增一个位于多层新目录中的文件"""
+    seen = 0
+    stack = [tree.node(base)]
+    while stack:
+        node = stack.pop()
+        for child in node["children"].values():
+            if child["is_dir"]:
+                stack.append(child)
+                continue
+            seen += 1
+            if seen % 100 == 0:
+                child["size"] += 1
+                child["modified"] = "2024-06-01T00:00:00Z"
+    tree.add_file(f"{base}/new/deep/nested/file.bin", 1024, "2024-06-01T00:00:00Z")
+
+
+def prepare_tree(scenario: str, entries: int, args) -> MockTree:
+    """
+    initial: 目标目录已创建但为空的首次同步
+    resync: 目标目录与源目录一致，测量无变更时的开销
+    update: 目标目录与源目录一致后，源目录约 1% 的文件发生变更
+    plan: 与 update 相同的目录树，先生成 JSON Lines 同步计划，再解析并执行计划
+    move: 与 initial 相同的目录树，以移动模式同步两轮，结束后源目录应为空
+    incremental: 与 resync 相同的目录树，先做一轮增量同步建立状态，再修改源目录后测量第二轮增量同步
+    """
+    tree = MockTree()
+    build_tree(tree, SRC_DIR, entries, args.files_per_dir, args.dirs_per_dir)
+    if scenario in ("initial", "move"):
+        tree.mkdir(DST_DIR)
+    if scenario in ("resync", "update", "plan", "incremental"):
+        tree.mkdir("/dst")["children"]["data"] = copy.deepcopy(tree.node(SRC_DIR))
+    if scenario in ("update", "plan"):
+        touch_files(tree, SRC_DIR)
+    return tree
+
+
+def run_case(size_name: str, scenario: str, engine: str, args) -> Dict:
+    entries = SIZES[size_name]
+    tree = prepare_tree(scenario, entries, args)
+    files, dirs = tree.count(SRC_DIR)
+    alist = MockAlist(tree, args.latency, args.error_rate, args.error_mode, args.task_duration)
+    sync_class = alist_sync.AsyncAlistSync if engine == "async" else alist_sync.AlistSync
+    options = {}
+    if scenario == "move":
+        options["move_file_action"] = True
+    with tempfile.TemporaryDirectory() as state_dir, MockAlistServer(alist) as server:
+        if scenario == "incremental":
+            options.update(incremental=True, state_db_path=os.path.join(state_dir, "state.db"))
+        sync = sync_class(server.url, token=TOKEN, exclude_list=[], concurrency=args.concurrency,
+                          batch_size=args.batch_size, page_size=args.page_size,
+                          max_copy_tasks=args.max_copy_tasks, adaptive_concurrency=args.adaptive,
+                          replace_strategy=args.replace_strategy, **options)
+        try:
+            sync.login()
+            if scenario == "incremental":
+                # 第一轮建立增量状态，不计入测量
+                sync.sync_directories(SRC_DIR, DST_DIR)
+                with tree.lock:
+                    touch_files(tree, SRC_DIR)
+            with tree.lock:
+                expected = tree.snapshot(SRC_DIR)
+            alist.reset_counts()
+            start = time.perf_counter()
+            if scenario == "plan":
+                lines = [json.dumps(record, ensure_ascii=False) for record in sync.iter_plan(SRC_DIR, DST_DIR)]
+                result = sync.execute_plan(alist_sync.parse_plan(lines))
+            elif scenario == "move":
+                # 移动模式下新文件先复制，下一轮确认目标已存在后才删除源文件和空目录
+                result = sync.sync_directories(SRC_DIR, DST_DIR)
+                result = sync.sync_directories(SRC_DIR, DST_DIR) and result
+            else:
+                result = sync.sync_directories(SRC_DIR, DST_DIR)
+            elapsed = time.perf_counter() - start
+        finally:
+            sync.close()
+        with tree.lock:
+            if scenario == "move":
+                consistent = tree.snapshot(SRC_DIR) == {} and tree.snapshot(DST_DIR) == expected
+            else:
+                consistent = tree.snapshot(SRC_DIR) == tree.snapshot(DST_DIR)
+
+    requests = sum(alist.counts.values())
+    return {
+        "size": size_name,
+        "scenario": scenario,
+        "engine": engine,
+        "files": files,
+        "dirs": dirs,
+        "result": result,
+        "consistent": consistent,
+        "seconds": round(elapsed, 3),
+        "requests": requests,
+        "requests_per_file": round(requests / files, 4) if files else 0,
+        "injected_errors": sum(alist.errors.values()),
+        "endpoints": dict(sorted(alist.counts.items())),
+    }
+
+
+def print_report(rows: List[Dict]):
+    header = f"{'规模':>6} {'场景':>8} {'引擎':>7} {'文件数':>9} {'耗时(秒)':>10} {'请求数':>9} {'请求/文件':>10} {'结果':>6}"
+    print(header)
+    print("-" * 88)
+    for row in rows:
+        status = "OK" if row["result"] and row["consistent"] else "FAIL"
+        print(f"{row['size']:>6} {row['scenario']:>8} {row['engine']:>7} {row['files']:>9} {row['seconds']:>10.3f} "
+              f"{row['requests']:>9} {row['requests_per_file']:>10.4f} {status:>6}")
+        endpoints = ", ".join(f"{path.replace('/api/', '')}={count}" for path, count in row["endpoints"].items())
+        print(f"{'':>6} {endpoints}")
+
+
+def compare_baseline(rows: List[Dict], baseline: List[Dict], tolerance: float, time_tolerance: float) -> List[str]:
+    """
+    与基线结果按 (规模, 场景, 引擎) 比较，每个文件的请求数超过基线的 (1 + tolerance) 倍
+    或耗时超过基线的 (1 + time_tolerance) 倍时视为性能回退，返回回退说明
+    """
+    previous = {(row["size"], row["scenario"], row["engine"]): row for row in baseline}
+    regressions = []
+    for row in rows:
+        key = (row["size"], row["scenario"], row["engine"])
+        base = previous.get(key)
+        if base is None:
+            print(f"{' '.join(key)}: 基线中没有该场景，跳过比较")
+            continue
+        checks = (("请求/文件", "requests_per_file", tolerance), ("耗时(秒)", "seconds", time_tolerance))
+        for label, field, limit in checks:
+            if row[field] > base[field] * (1 + limit):
+                regressions.append(f"{' '.join(key)}: {label} {row[field]} 超过基线 {base[field]} 的 {1 + limit:.2f} 倍")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="alist_sync 同步引擎基准测试")
+    parser.add_argument("--sizes", default="1k", help=f"目录树规模，逗号分隔，可选 {','.join(SIZES)}")
+    parser.add_argument("--scenarios", default="initial,resync,update", help="场景，逗号分隔: initial,resync,update,plan,move,incremental")
+    parser.add_argument("--engine", default="thread", help="同步引擎，逗号分隔: thread,async")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--max-copy-tasks", type=int, default=0)
+    parser.add_argument("--adaptive", action="store_true", help="开启自适应并发")
+    parser.add_argument("--replace-strategy", choices=alist_sync.AlistSync.REPLACE_STRATEGIES, default="remove",
+                        help="已变更文件的替换策略")
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--dirs-per-dir", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟服务每个请求的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务注入错误的概率")
+    parser.add_argument("--error-mode", choices=("http", "throttle"), default="http")
+    parser.add_argument("--task-duration", type=float, default=0.0, help="复制任务在未完成队列中停留的秒数")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与 --json 写入的基线结果比较，出现性能回退时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="每个文件的请求数允许超过基线的比例")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="耗时允许超过基线的比例")
+    parser.add_argument("--verbose", action="store_true", help="输出同步日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    rows = []
+    for size_name in [s.strip().lower() for s in args.sizes.split(",") if s.strip()]:
+        if size_name not in SIZES:
+            parser.error(f"未知的规模: {size_name}")
+        for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            for engine in [e.strip() for e in args.engine.split(",") if e.strip()]:
+                rows.append(run_case(size_name, scenario, engine, args))
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+    failed = not all(row["result"] and row["consistent"] for row in rows)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_baseline(rows, json.load(f), args.tolerance, args.time_tolerance)
+        for regression in regressions:
+            print(f"性能回退: {regression}")
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()